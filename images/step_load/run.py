@@ -1,12 +1,14 @@
 import asyncio
 import aiohttp
-import time
 import logging
 import argparse
+import matplotlib
+matplotlib.use("Agg")  # 容器内无图形界面，只输出 PNG
 import matplotlib.pyplot as plt
 import signal
 import sys
 import math
+from array import array
 
 # Setup logging
 logging.basicConfig(
@@ -16,6 +18,8 @@ logging.basicConfig(
 
 class PhaseStats:
     def __init__(self):
+        # 当前区间计数 [请求数, 成功数, 失败数]，只在区间汇总时并入累计值
+        self._counts = array('q', [0, 0, 0])
         self.reset()
         self.qps_records = []
         self.error_rate_records = []
@@ -24,39 +28,39 @@ class PhaseStats:
         self.total_requests = 0
         self.success_requests = 0
         self.error_requests = 0
-        self.last_success = 0
-        self.last_errors = 0
-        self.last_requests = 0
-
-    def record_result(self, status):
-        self.total_requests += 1
-        self.last_requests += 1
-        if status and 200 <= status < 300:
-            self.success_requests += 1
-            self.last_success += 1
-        else:
-            self.error_requests += 1
-            self.last_errors += 1
-
-    def snapshot(self, interval_sec):
-        qps = self.last_success / interval_sec
-        total = self.last_requests
-        err_rate = (self.last_errors / total * 100) if total > 0 else 0.0
+        self._counts[0] = self._counts[1] = self._counts[2] = 0
+
+    def record_batch(self, statuses):
+        n = len(statuses)
+        succ = sum(1 for s in statuses if s and 200 <= s < 300)
+        c = self._counts
+        c[0] += n
+        c[1] += succ
+        c[2] += n - succ
+
+    def _drain(self):
+        """取出当前区间计数并清零，同时累加到阶段总数。"""
+        c = self._counts
+        total, succ, err = c[0], c[1], c[2]
+        c[0] = c[1] = c[2] = 0
+        self.total_requests += total
+        self.success_requests += succ
+        self.error_requests += err
+        return total, succ, err
+
+    def snapshot(self, interval_sec, total, succ, err):
+        qps = succ / interval_sec
+        err_rate = (err / total * 100) if total > 0 else 0.0
         self.qps_records.append(qps)
         self.error_rate_records.append(err_rate)
         return qps, err_rate
 
     def log_interval_summary(self, interval_sec):
-        total = self.last_requests
-        succ = self.last_success
-        err = self.last_errors
-        qps, err_rate = self.snapshot(interval_sec)
+        total, succ, err = self._drain()
+        qps, err_rate = self.snapshot(interval_sec, total, succ, err)
         succ_rate = (succ / total * 100) if total > 0 else 0.0
         logging.info(f"[Interval Summary] Total: {total}, Success: {succ} ({succ_rate:.1f}%), "
                      f"Errors: {err} ({err_rate:.1f}%), QPS: {qps:.2f}")
-        self.last_success = 0
-        self.last_errors = 0
-        self.last_requests = 0
 
     def log_phase_summary(self, duration_sec):
         total = self.total_requests
@@ -77,37 +81,59 @@ async def fetch(session, url):
     except:
         return None
 
+async def fire_batch(session, url, batch_size, stats: PhaseStats):
+    # 一批请求并发发出，全部返回后一次性计入统计
+    statuses = await asyncio.gather(*(fetch(session, url) for _ in range(batch_size)))
+    stats.record_batch(statuses)
+
 async def run_sine_load(session, url, peak, base, period, stats: PhaseStats):
     interval = 2  # 每2秒采样一次正弦曲线
     slices = 10  # 每2秒内分成10批，每批间隔200ms发请求
     slice_interval = interval / slices
-    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    # 使用事件循环的单调时钟，按绝对时间点排布每一批，避免 sleep 累积漂移
+    start_time = loop.time()
+    next_slice = start_time
+    # 正弦参数只计算一次
+    sin = math.sin
+    omega = 2 * math.pi / period
+    amp = peak - base
+    # 持有在途批次的引用，防止任务被回收；完成时由回调移除，集合大小即在途批次数
+    inflight = set()
 
     async def ticker():
         while True:
             await asyncio.sleep(10)
             stats.log_interval_summary(10)
 
-    asyncio.create_task(ticker())
-
-    while True:
-        t = time.time() - start_time
-        # 用 2π 控制完整周期
-        qps = base + (peak - base) * math.sin(2 * math.pi * t / period)
-        qps = max(0, qps)
-        total_requests = int(qps * interval)
-        batch_size = total_requests // slices
+    ticker_task = asyncio.create_task(ticker())
 
-        logging.info(f"[Wave] t={int(t)}s  -> QPS Target ≈ {int(qps)} -> Requests in next 2s = {total_requests}")
-
-        for _ in range(slices):
-            for _ in range(batch_size):
-                task = asyncio.create_task(fetch(session, url))
-                task.add_done_callback(lambda fut: stats.record_result(fut.result()))
-            await asyncio.sleep(slice_interval)
+    try:
+        while True:
+            t = loop.time() - start_time
+            # omega = 2π/period 控制完整周期
+            qps = base + amp * sin(omega * t)
+            qps = max(0, qps)
+            total_requests = int(qps * interval)
+            batch_size = total_requests // slices
+
+            logging.info(f"[Wave] t={int(t)}s  -> QPS Target ≈ {int(qps)} -> Requests in next 2s = {total_requests}, "
+                         f"in-flight batches = {len(inflight)}")
+
+            for _ in range(slices):
+                if batch_size:
+                    task = asyncio.create_task(fire_batch(session, url, batch_size, stats))
+                    inflight.add(task)
+                    task.add_done_callback(inflight.discard)
+                next_slice += slice_interval
+                await asyncio.sleep(max(0.0, next_slice - loop.time()))
+    finally:
+        ticker_task.cancel()
 
 async def run(url, peak, base, period, stats: PhaseStats):
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=None)) as session:
+    # 单个 session 复用 keep-alive 连接；limit=0 不限制并发连接数，DNS 结果缓存 5 分钟
+    connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300, keepalive_timeout=75)
+    async with aiohttp.ClientSession(connector=connector) as session:
         await run_sine_load(session, url, peak, base, period, stats)
 
 def plot_qps_and_error_rate(qps_records, error_rate_records):
@@ -1,10 +1,12 @@
-import logging, threading, argparse, os, time
+import logging, threading, argparse, os, time, signal
 from cluster.NodeMonitor import NodeMonitor
 from cluster.PodMonitor import PodMonitor
 from cluster.NodePodMonitor import NodePodMonitor
 from cluster.NginxSLOMonitor import NginxSLOMonitor
 from cluster.DeploymentMonitor import DeploymentMonitor
 from cluster.JobMonitor import JobMonitor
+from cluster.ClusterMonitor import ClusterMonitor
+from cluster.MonitorScheduler import MonitorScheduler
 
 def main():
     # 入口参数
@@ -24,41 +26,56 @@ def main():
             format="%(asctime)s [%(name)s] %(levelname)s: %(message)s"
         )
     else:
+        # 默认仅警告级别以上输出至控制台（不创建文件）
         logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(name)s] %(levelname)s: %(message)s"
+            level=logging.WARNING,
+            format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+            force=True
         )
-        # 默认仅警告级别以上输出至控制台（不创建文件）
-        logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
 
     prom_url = args.prom
     interval = args.interval
     logging.info(f"Starting monitors with interval={interval}s, Prometheus={prom_url}")
+    # 所有监控器共享一个 ClusterMonitor（一个 ApiClient / 连接池 / 查询缓存）
+    cluster = ClusterMonitor.instance(cache_ttl=interval / 2)
+    # 所有监控器共享一个停止信号
+    stop = threading.Event()
+    # 后台 watch 集群状态，监控周期内的 Pod/Node 查询直接读内存
+    cluster.start_state_cache(stop_event=stop)
     # 初始化监控实例
-    node_monitor = NodeMonitor(prom_url, interval)
-    pod_monitor = PodMonitor(prom_url, interval)
-    dist_monitor = NodePodMonitor(prom_url, interval)
-    slo_monitor = NginxSLOMonitor(prom_url, interval)
-    deploy_monitor = DeploymentMonitor(interval)
-    job_monitor = JobMonitor(interval)
-    monitors = [node_monitor, pod_monitor, dist_monitor, slo_monitor,deploy_monitor, job_monitor]
+    node_monitor = NodeMonitor(prom_url, interval, stop_event=stop)
+    pod_monitor = PodMonitor(prom_url, interval, cluster=cluster, stop_event=stop)
+    dist_monitor = NodePodMonitor(cluster=cluster)
+    slo_monitor = NginxSLOMonitor(prom_url, interval, cluster=cluster, stop_event=stop)
+    deploy_monitor = DeploymentMonitor(cluster=cluster)
+    job_monitor = JobMonitor(cluster=cluster)
+    # 事件驱动的监控器订阅共享缓存，回调在缓存的 watch 线程中执行
+    for m in (dist_monitor, deploy_monitor, job_monitor):
+        m.start()
+    # 轮询式监控器共用一个调度线程
+    scheduler = MonitorScheduler([node_monitor, pod_monitor, slo_monitor], stop_event=stop)
+    runners = [scheduler]
 
     # 创建并启动线程
     threads = []
-    for monitor in monitors:
-        t = threading.Thread(target=monitor.run, name=monitor.__class__.__name__, daemon=True)
+    for runner in runners:
+        t = threading.Thread(target=runner.run, name=runner.__class__.__name__, daemon=True)
         t.start()
         threads.append(t)
     logging.info("All monitoring threads started.")
-    # 主线程保持运行
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logging.info("Stopping monitors...")
-        # 若需优雅停止，可在各monitor中检查一个标志，此处简单退出
-        # （由于daemon=True，主程序退出时线程也会结束）
-        return
+    # 主线程阻塞在停止信号上，收到 SIGINT/SIGTERM 时由信号处理函数唤醒（稳态下零唤醒）
+    def _on_signal(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGTERM, _on_signal)
+    stop.wait()
+
+    logging.info("Stopping monitors...")
+    # 等待各monitor完成当前周期正在进行的请求与写入
+    # （仍保留daemon=True，超时未退出的线程随主程序结束）
+    for t in threads:
+        t.join(timeout=interval + 1)
 
 
 if __name__ == "__main__":
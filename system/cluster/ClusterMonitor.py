@@ -1,15 +1,54 @@
+import json
 import logging
+import os
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from datetime import datetime
 
 import urllib3
-from kubernetes import client, config
-from kubernetes.client import PolicyV1Api
+from urllib3.connection import HTTPConnection
+from kubernetes import client, config, watch
 from kubernetes.client.rest import ApiException
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库
+    _json_loads = json.loads
+
+
+def _parse_time(value):
+    """解析 API 返回的 RFC3339 时间字符串（如 2025-01-01T00:00:00Z），空值返回 None。"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _keepalive_socket_options() -> list:
+    """urllib3 默认 socket 选项（TCP_NODELAY）加上 TCP keep-alive：空闲 30s 后每 10s 探测一次，3 次无响应断开。"""
+    opts = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        # 这几个选项只在 Linux 等平台上存在
+        if hasattr(socket, name):
+            opts.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return opts
+
+_INSTANCE = None
+_INSTANCE_LOCK = threading.Lock()
+
+
 class ClusterMonitor:
     """通过Kubernetes API与集群交互"""
-    def __init__(self):
+    def __init__(self, cache_ttl: float = 2.0, pool_maxsize: int = None):
+        """
+        :param cache_ttl: list 类查询结果的缓存时间（秒），同一采样周期内多次调用只访问一次 API Server
+        :param pool_maxsize: urllib3 连接池大小，缺省为 max(32, CPU 数 * 5)；同一个实例被所有监控线程共享，
+                             各 API 对象共用一个 ApiClient 及其连接池
+        """
+        if pool_maxsize is None:
+            pool_maxsize = max(32, (os.cpu_count() or 1) * 5)
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         try:
             config.load_incluster_config()
@@ -17,116 +56,231 @@ class ClusterMonitor:
             config.load_kube_config("./config/config")
             self.logger.info(f"在本地连接到远程集群")
 
-        self.core_v1 = client.CoreV1Api()
-        self.batch_v1 = client.BatchV1Api()
-        self.apps_v1 = client.AppsV1Api()
+        cfg = client.Configuration.get_default_copy()
+        cfg.connection_pool_maxsize = pool_maxsize
+        self.api_client = client.ApiClient(cfg)
+        # 连接池新建的连接开启 TCP keep-alive：长时间空闲（watch 之间、两次采样之间）的连接
+        # 不会被中间的 NAT / 防火墙静默丢弃，后续请求继续复用而不必重新 TLS 握手
+        self.api_client.rest_client.pool_manager.connection_pool_kw["socket_options"] = _keepalive_socket_options()
+        self.core_v1 = client.CoreV1Api(self.api_client)
+        self.batch_v1 = client.BatchV1Api(self.api_client)
+        self.apps_v1 = client.AppsV1Api(self.api_client)
 
-    def get_running_pods(self, namespace):
+        self.cache_ttl = cache_ttl
+        self._cache = {}  # key -> (过期时间, 结果)
+        self._cache_lock = threading.Lock()
+        # 基于 watch 的集群状态缓存，由 start_state_cache() 开启；开启后各查询直接读内存
+        self.state = None
+
+    @classmethod
+    def instance(cls, **kwargs) -> "ClusterMonitor":
         """
-        被PodMonitor调用获得命名空间下正在running的pod名字集合
+        返回进程内共享的 ClusterMonitor，首次调用时创建。
+        kwargs 只在首次创建时生效（见 __init__ 参数）。
         """
-        pod_set = set()
-        try:
-            pods = self.core_v1.list_namespaced_pod(
-                namespace=namespace,
-                field_selector="status.phase=Running"
-            )
-            for p in pods.items:
-                pod_set.add(p.metadata.name)
-        except Exception as e:
-            self.logger.error(f"在获取{namespace}空间下正在running的pod名字集合时发生报错\n{e}")
+        global _INSTANCE
+        if _INSTANCE is None:
+            with _INSTANCE_LOCK:
+                if _INSTANCE is None:
+                    _INSTANCE = cls(**kwargs)
+        return _INSTANCE
 
-        return pod_set
+    def start_state_cache(self, namespace: str = "default", stop_event: threading.Event = None, kinds=None):
+        """
+        启动 ClusterStateCache（后台 watch kinds 指定的资源，缺省为 Pod/Node/Deployment/Job）并返回。
+        缓存已存在时只补充启动尚未 watch 的资源，namespace / stop_event 以首次调用为准。
+        之后 get_running_pods / get_node_internal_ips 在缓存同步完成后不再访问 API Server，
+        DeploymentMonitor / JobMonitor 等通过 ClusterStateCache.subscribe 接收事件。
+        """
+        from .ClusterStateCache import ClusterStateCache
+        if self.state is None:
+            self.state = ClusterStateCache(self, namespace, stop_event)
+        self.state.start(kinds)
+        return self.state
 
-    def get_pod_node_map(self, namespace: str = "default"):
+    def _cached(self, key, loader):
+        """
+        在 cache_ttl 内复用 loader() 的结果；loader 抛出的异常不会被缓存。
+        返回值被多个调用方共享，调用方不应修改。
         """
-        返回指定命名空间下每个节点(node)对应的 Running Pod 名称集合：
-            { node_name: { pod1, pod2, ... }, ... }
+        now = time.monotonic()
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+        value = loader()
+        with self._cache_lock:
+            self._cache[key] = (now + self.cache_ttl, value)
+        return value
 
-        被NodePodMonitor调用
+    def _list_raw(self, list_func, *args, **kwargs) -> dict:
         """
-        mapping = {}
-        try:
-            resp = self.core_v1.list_namespaced_pod(
+        以 _preload_content=False 调用 list_* 接口，直接解析原始 JSON，
+        跳过 kubernetes client 的 OpenAPI 模型反序列化。返回 {"metadata": ..., "items": [...]}
+        默认 resource_version="0"：由 API Server 的 watch cache 直接返回，不做 etcd 一致性读。
+        """
+        kwargs.setdefault("resource_version", "0")
+        resp = list_func(*args, _preload_content=False, **kwargs)
+        return _json_loads(resp.data)
+
+    def get_running_pods(self, namespace):
+        """
+        被PodMonitor调用获得命名空间下正在running的pod名字集合
+        """
+        if self.state is not None and self.state.serves_namespace(namespace):
+            return self.state.running_pods()
+
+        def load():
+            data = self._list_raw(
+                self.core_v1.list_namespaced_pod,
                 namespace=namespace,
                 field_selector="status.phase=Running"
             )
-            for p in resp.items:
-                node = p.spec.node_name or "<unknown>"
-                mapping.setdefault(node, set()).add(p.metadata.name)
+            return self.running_pod_names(data["items"])
+
+        try:
+            return self._cached(("running_pods", namespace), load)
         except Exception as e:
-            self.logger.error(f"获取 Pod-Node 映射失败: {e}")
-        return mapping
+            self.logger.error(f"在获取{namespace}空间下正在running的pod名字集合时发生报错\n{e}")
+            return frozenset()
 
     def get_node_internal_ips(self) -> dict[str, str]:
         """
         获取集群中每个 Node 的 InternalIP：
         返回  { node_name: internal_ip, ... }
 
-        被NodePodMonitor调用
+        被NginxSLOMonitor调用
         """
-        ip_map: dict[str, str] = {}
+        if self.state is not None and self.state.is_synced("nodes"):
+            return self.state.node_internal_ips()
+
+        def load():
+            data = self._list_raw(self.core_v1.list_node)
+            return {n["metadata"]["name"]: self.node_internal_ip(n) for n in data["items"]}
+
         try:
-            nodes = self.core_v1.list_node().items
-            for n in nodes:
-                name = n.metadata.name
-                ip = "<unknown>"
-                for a in n.status.addresses:
-                    if a.type == "InternalIP":
-                        ip = a.address
-                        break
-                ip_map[name] = ip
+            return self._cached("node_internal_ips", load)
         except Exception as exc:
             self.logger.error(f"获取 Node IP 失败: {exc}")
-        return ip_map
+            return {}
 
-    def list_deployments(self, namespace: str = "default"):
+    def list_with_version(self, list_func, namespace: str = None, consistent: bool = False):
         """
-        列出 Namespace 下所有 Deployment 并返回状态字典：
-          { name: {"desired": int, "available": int, "ready": int}, ... }
+        list 指定命名空间下的资源（原始 JSON），返回 (items, resourceVersion)，
+        resourceVersion 用作随后 watch_stream 的起点。
+        namespace 为 None 时用于集群级资源（如 list_node）。
+        consistent=True 时不指定 resourceVersion，由 etcd 做一致性读（结果不会比已收到的 watch 事件旧）。
         """
-        out = {}
-        try:
-            resp = self.apps_v1.list_namespaced_deployment(namespace)
-            for d in resp.items:
-                name = d.metadata.name
-                out[name] = {
-                    "desired": d.spec.replicas or 0,
-                    "available": d.status.available_replicas or 0,
-                    "ready": d.status.ready_replicas or 0
-                }
-        except Exception as e:
-            self.logger.error(f"list_deployments failed: {e}")
-        return out
-
-    def list_jobs(self, namespace: str = "default"):
-        """
-        列出 Namespace 下所有 Job 并返回状态字典：
-          { name: {
-                "completions": spec.completions,
-                "succeeded": status.succeeded,
-                "active": status.active,
-                "failed": status.failed,
-                "start_time": status.start_time (datetime),
-                "completion_time": status.completion_time (datetime)
-            }, ... }
-        """
-        out = {}
-        try:
-            resp = self.batch_v1.list_namespaced_job(namespace)
-            for j in resp.items:
-                name = j.metadata.name
-                out[name] = {
-                    "completions": j.spec.completions or 0,
-                    "succeeded": j.status.succeeded or 0,
-                    "active": j.status.active or 0,
-                    "failed": j.status.failed or 0,
-                    "start_time": j.status.start_time,
-                    "completion_time": j.status.completion_time
-                }
-        except Exception as e:
-            self.logger.error(f"list_jobs failed: {e}")
-        return out
+        kwargs = {"namespace": namespace} if namespace else {}
+        if consistent:
+            kwargs["resource_version"] = None
+        data = self._list_raw(list_func, **kwargs)
+        return data["items"], data["metadata"].get("resourceVersion")
+
+    def watch_stream(self, list_func, namespace: str, resource_version: str,
+                     stop_event: threading.Event, timeout_seconds: int = 60):
+        """
+        从 resource_version 开始 watch 资源变化，产出 (event_type, raw_object)，
+        event_type 为 ADDED / MODIFIED / DELETED。
+          - 每个 watch 连接在 timeout_seconds 后由服务端关闭，随后从最新 resourceVersion 续上；
+          - BOOKMARK 事件只推进 resourceVersion，不产出；
+          - resourceVersion 过期（410 Gone）或连接出错时生成器结束，调用方应重新 list 后再 watch；
+          - stop_event 被 set 后在当前连接结束时退出；
+          - namespace 为 None 时 watch 集群级资源。
+        """
+        rv = resource_version
+        kwargs = {"namespace": namespace} if namespace else {}
+        while not stop_event.is_set():
+            w = watch.Watch()
+            try:
+                for event in w.stream(list_func,
+                                      **kwargs,
+                                      resource_version=rv,
+                                      timeout_seconds=timeout_seconds,
+                                      allow_watch_bookmarks=True):
+                    etype = event["type"]
+                    obj = event["raw_object"]
+                    if etype == "ERROR":
+                        self.logger.warning(f"watch 收到错误事件，需要重新 list: {obj}")
+                        return
+                    rv = obj["metadata"].get("resourceVersion", rv)
+                    if etype == "BOOKMARK":
+                        continue
+                    yield etype, obj
+                    if stop_event.is_set():
+                        return
+            except ApiException as e:
+                if e.status == 410:
+                    self.logger.info(f"resourceVersion {rv} 已过期，重新 list")
+                else:
+                    self.logger.error(f"watch 失败: {e}")
+                return
+            except Exception as e:
+                self.logger.error(f"watch 连接异常: {e}")
+                return
+            finally:
+                w.stop()
+
+    def wait_for_node_condition(self, node_name: str, cond_type: str = "Ready", cond_status: str = "True",
+                                timeout: float = 300) -> bool:
+        """
+        等待节点的 cond_type 条件变为 cond_status，满足时返回 True，超时返回 False。
+        所有等待共用 ClusterStateCache 的一个 Node watch，按节点名唤醒，
+        同时等待多个节点（如 VMManager.create_nodes）也只有一条 watch 连接。
+        """
+        state = self.start_state_cache(kinds=("nodes",))
+        return state.wait_for("nodes", node_name,
+                              lambda n: self.node_condition(n, cond_type) == cond_status, timeout)
+
+    @staticmethod
+    def node_condition(n: dict, cond_type: str):
+        """从原始 Node JSON 取出 cond_type 条件的 status（"True"/"False"/"Unknown"），不存在时返回 None。"""
+        for c in (n.get("status") or {}).get("conditions") or ():
+            if c.get("type") == cond_type:
+                return c.get("status")
+        return None
+
+    @staticmethod
+    def running_pod_names(items) -> frozenset:
+        """从原始 Pod JSON 列表取出 Running Pod 的名字集合（frozenset，可被多个调用方安全共享）。"""
+        return frozenset(p["metadata"]["name"] for p in items
+                         if (p.get("status") or {}).get("phase") == "Running")
+
+    @staticmethod
+    def node_internal_ip(n: dict) -> str:
+        """从原始 Node JSON 提取 InternalIP，缺失时返回 "<unknown>"。"""
+        for a in (n.get("status") or {}).get("addresses") or ():
+            if a.get("type") == "InternalIP":
+                return a.get("address", "<unknown>")
+        return "<unknown>"
+
+    @staticmethod
+    def deployment_status(d: dict) -> tuple:
+        """从原始 Deployment JSON 提取 (desired, available, ready)。"""
+        spec = d.get("spec") or {}
+        status = d.get("status") or {}
+        return (
+            spec.get("replicas") or 0,
+            status.get("availableReplicas") or 0,
+            status.get("readyReplicas") or 0
+        )
+
+    @staticmethod
+    def job_status(j: dict) -> tuple:
+        """
+        从原始 Job JSON 提取
+        (completions, succeeded, active, failed, start_time, completion_time)，时间为 datetime 或 None。
+        """
+        spec = j.get("spec") or {}
+        status = j.get("status") or {}
+        return (
+            spec.get("completions") or 0,
+            status.get("succeeded") or 0,
+            status.get("active") or 0,
+            status.get("failed") or 0,
+            _parse_time(status.get("startTime")),
+            _parse_time(status.get("completionTime"))
+        )
 
     def cordon_node(self, node_name: str):
         """
@@ -140,6 +294,32 @@ class ClusterMonitor:
             self.logger.error(f"Failed to cordon {node_name}: {e}")
             raise
 
+    def _evict_one(self, name: str, ns: str, grace_period_seconds: int):
+        """驱逐单个 Pod；Eviction 被拒绝（PDB 等）时直接删除。"""
+        eviction = client.V1Eviction(
+            metadata=client.V1ObjectMeta(name=name, namespace=ns),
+            delete_options=client.V1DeleteOptions(grace_period_seconds=grace_period_seconds)
+        )
+        try:
+            # 尝试优雅驱逐
+            self.core_v1.create_namespaced_pod_eviction(
+                name=name, namespace=ns, body=eviction
+            )
+            self.logger.debug(f"Eviction triggered for Pod {name}")
+        except ApiException as e:
+            # PDB 阻止或其它错误，则强制删除
+            self.logger.warning(f"Eviction failed for {name} (status {e.status}), deleting directly")
+            try:
+                self.core_v1.delete_namespaced_pod(
+                    name=name,
+                    namespace=ns,
+                    grace_period_seconds=grace_period_seconds,
+                    body=client.V1DeleteOptions()
+                )
+                self.logger.debug(f"Deleted Pod {name} bypassing Eviction")
+            except ApiException as delete_err:
+                self.logger.error(f"Failed to delete Pod {name}: {delete_err}")
+
     def drain_node(self, node_name: str, grace_period_seconds: int = 30, timeout: int = 120):
         """
         Evict all pods from the node, blocking until done or timeout.
@@ -154,31 +334,19 @@ class ClusterMonitor:
             self.logger.info(f"没有pods No pods found on node {node_name} to evict.")
             return
 
-        for pod in pods:
-            name = pod.metadata.name
-            ns = pod.metadata.namespace
-            eviction = client.V1Eviction(
-                metadata=client.V1ObjectMeta(name=name, namespace=ns),
-                delete_options=client.V1DeleteOptions(grace_period_seconds=grace_period_seconds)
-            )
-            try:
-                # 尝试优雅驱逐
-                self.core_v1.create_namespaced_pod_eviction(
-                    name=name, namespace=ns, body=eviction
-                )
-                self.logger.debug(f"Eviction triggered for Pod {name}")
-            except ApiException as e:
-                # PDB 阻止或其它错误，则强制删除
-                self.logger.warning(f"Eviction failed for {name} (status {e.status}), deleting directly")
-                try:
-                    self.core_v1.delete_namespaced_pod(
-                        name=name,
-                        namespace=ns,
-                        grace_period_seconds=grace_period_seconds,
-                        body=client.V1DeleteOptions()
-                    )
-                    self.logger.debug(f"Deleted Pod {name} bypassing Eviction")
-                except ApiException as delete_err:
-                    self.logger.error(f"Failed to delete Pod {name}: {delete_err}")
+        # 并发驱逐：各请求共用 ApiClient 的连接池，总耗时约为一次 RTT 而不是 N 次
+        deadline = time.monotonic() + timeout
+        ex = ThreadPoolExecutor(max_workers=min(16, len(pods)), thread_name_prefix="evict")
+        futures = [
+            ex.submit(self._evict_one, pod.metadata.name, pod.metadata.namespace, grace_period_seconds)
+            for pod in pods
+        ]
+        try:
+            for f in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                f.result()
+        except FuturesTimeout:
+            self.logger.warning(f"驱逐 {node_name} 上的 Pod 超过 {timeout}s，取消尚未开始的请求")
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
 
         self.logger.info(f"Eviction/delete attempted once for all pods on node {node_name}")
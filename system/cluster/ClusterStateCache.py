@@ -0,0 +1,215 @@
+# cluster/cluster_state_cache.py
+
+"""
+ClusterStateCache
+=================
+
+基于 watch 的集群状态内存缓存（类似 client-go 的 informer）：
+  - 每类资源（pods / nodes / deployments / jobs）一个后台线程，按需启动：先 list 建立快照，
+    再从返回的 resourceVersion 开始 watch，按到达顺序应用 ADDED / MODIFIED / DELETED；
+    只有 watch 结束（410 Gone / 连接异常）后才重新 list。
+  - 重新 list 使用一致性读，结果整体替换该资源的字典，与替换前的差异作为事件通知监听者；
+    resourceVersion 按约定视为不透明字符串，只比较是否相等。
+  - 对象以原始 JSON 字典保存，不做 OpenAPI 模型反序列化。
+  - 事件监听：subscribe() 注册的回调按批收到 [(event_type, raw_object), ...]，
+    回调在释放状态锁之后调用，一个监控器的文件 I/O 不会阻塞其它资源的 watch 与查询。
+  - wait_for() 按对象名挂在同一个 watch 上等待条件满足（如节点 Ready），不为每次等待单独 watch。
+ClusterMonitor 在缓存同步完成后直接从这里读取，不再访问 API Server。
+"""
+
+import logging, threading
+
+
+class ClusterStateCache:
+    """在内存中维护 Pod / Node / Deployment / Job 的最新状态。"""
+
+    KINDS = ("pods", "nodes", "deployments", "jobs")
+
+    def __init__(self, cluster, namespace: str = "default", stop_event: threading.Event = None):
+        """
+        :param cluster: 提供 API 对象与 list/watch 辅助方法的 ClusterMonitor
+        :param namespace: 命名空间级资源（Pod/Deployment/Job）所在的命名空间
+        :param stop_event: 停止信号，set() 后各后台线程在当前 watch 连接结束时退出
+        """
+        self.cluster = cluster
+        self.namespace = namespace
+        self.stop_event = stop_event or threading.Event()
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        # 状态锁：只保护内存字典与注册表，持有期间不做 I/O
+        self._lock = threading.Lock()
+        # kind -> 投递锁：同一资源的"更新状态 + 调用回调"串行进行，保证回调按事件顺序、不被并发调用
+        self._deliver = {kind: threading.Lock() for kind in self.KINDS}
+        # kind -> { name: raw_object }
+        self._objs = {kind: {} for kind in self.KINDS}
+        # kind -> 变更计数，派生视图按版本号缓存
+        self._version = {kind: 0 for kind in self.KINDS}
+        self._synced = {kind: threading.Event() for kind in self.KINDS}
+        self._views = {}  # view_name -> (version, value)
+        # kind -> [callback(events)]
+        self._listeners = {kind: [] for kind in self.KINDS}
+        self._threads = {}  # kind -> watch 线程
+        # (kind, name) -> [(predicate, Event)]，由 wait_for 注册
+        self._waiters = {}
+
+    def _list_func(self, kind: str):
+        c = self.cluster
+        return {
+            "pods": (c.core_v1.list_namespaced_pod, self.namespace),
+            "nodes": (c.core_v1.list_node, None),
+            "deployments": (c.apps_v1.list_namespaced_deployment, self.namespace),
+            "jobs": (c.batch_v1.list_namespaced_job, self.namespace),
+        }[kind]
+
+    def start(self, kinds=None):
+        """启动 kinds（缺省为全部资源）的 watch 线程（daemon），已启动的资源不重复启动。"""
+        with self._lock:
+            for kind in kinds or self.KINDS:
+                if kind in self._threads:
+                    continue
+                t = threading.Thread(target=self._watch_loop, args=(kind,),
+                                     name=f"ClusterStateCache-{kind}", daemon=True)
+                t.start()
+                self._threads[kind] = t
+
+    def subscribe(self, kind: str, callback):
+        """
+        注册 kind 资源的事件回调 callback(events)，events 为 [(event_type, raw_object), ...]。
+        已缓存的对象立即以 ADDED 事件回放一次；之后的回调在该资源的 watch 线程中调用（不持有状态锁），
+        同一资源的回调按顺序逐个调用。回调不应修改传入的对象。
+        """
+        with self._deliver[kind]:
+            with self._lock:
+                self._listeners[kind].append(callback)
+                replay = [("ADDED", o) for o in self._objs[kind].values()]
+            if replay:
+                self._call(kind, replay, (callback,))
+        self.start((kind,))
+
+    def _call(self, kind: str, events: list, listeners):
+        """逐个调用回调；单个回调出错只记录日志，不影响 watch 线程。"""
+        for cb in listeners:
+            try:
+                cb(events)
+            except Exception as e:
+                self.logger.error(f"{kind} listener {cb} failed: {e}")
+
+    def _publish(self, kind: str, events: list):
+        """
+        调用方持有 self._deliver[kind]、不持有 self._lock：
+        在状态锁内取监听者快照并唤醒条件已满足的 wait_for 等待者，释放后再调用回调。
+        """
+        with self._lock:
+            listeners = list(self._listeners[kind])
+            if self._waiters:
+                for etype, obj in events:
+                    if etype == "DELETED":
+                        continue
+                    for predicate, ev in self._waiters.get((kind, obj["metadata"]["name"]), ()):
+                        if predicate(obj):
+                            ev.set()
+        self._call(kind, events, listeners)
+
+    def wait_for(self, kind: str, name: str, predicate, timeout: float) -> bool:
+        """
+        等待 kind 资源中名为 name 的对象满足 predicate(raw_object)，满足时返回 True，超时返回 False。
+        对象已满足条件时立即返回；否则由该资源的共享 watch 在收到此对象的变更时唤醒。
+        """
+        key = (kind, name)
+        waiter = (predicate, threading.Event())
+        with self._lock:
+            obj = self._objs[kind].get(name)
+            if obj is not None and predicate(obj):
+                return True
+            self._waiters.setdefault(key, []).append(waiter)
+        self.start((kind,))
+        try:
+            return waiter[1].wait(timeout)
+        finally:
+            with self._lock:
+                waiters = self._waiters[key]
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def _relist(self, kind: str):
+        """
+        一致性读全量 list，整体替换该资源的字典，返回 resourceVersion；
+        与替换前的差异（新增 / resourceVersion 变化 / 消失）作为 ADDED / MODIFIED / DELETED 事件通知监听者。
+        """
+        func, ns = self._list_func(kind)
+        items, rv = self.cluster.list_with_version(func, ns, consistent=True)
+        objs = {o["metadata"]["name"]: o for o in items}
+        with self._deliver[kind]:
+            with self._lock:
+                old = self._objs[kind]
+                events = []
+                for name, o in objs.items():
+                    cur = old.get(name)
+                    if cur is None:
+                        events.append(("ADDED", o))
+                    elif cur["metadata"].get("resourceVersion") != o["metadata"].get("resourceVersion"):
+                        events.append(("MODIFIED", o))
+                events.extend(("DELETED", cur) for name, cur in old.items() if name not in objs)
+                self._objs[kind] = objs
+                self._version[kind] += 1
+            if events:
+                self._publish(kind, events)
+        self._synced[kind].set()
+        return rv
+
+    def _watch_loop(self, kind: str):
+        func, ns = self._list_func(kind)
+        while not self.stop_event.is_set():
+            try:
+                rv = self._relist(kind)
+            except Exception as e:
+                self.logger.error(f"list {kind} failed: {e}")
+                self.stop_event.wait(5)
+                continue
+            for etype, obj in self.cluster.watch_stream(func, ns, rv, self.stop_event):
+                name = obj["metadata"]["name"]
+                with self._deliver[kind]:
+                    with self._lock:
+                        if etype == "DELETED":
+                            self._objs[kind].pop(name, None)
+                        else:
+                            self._objs[kind][name] = obj
+                        self._version[kind] += 1
+                    self._publish(kind, [(etype, obj)])
+            # watch 结束（410 / 连接异常）：稍后重新 list，避免 API Server 异常时连续重试
+            self.stop_event.wait(1)
+
+    def is_synced(self, kind: str) -> bool:
+        """该资源是否已完成首次 list。"""
+        return self._synced[kind].is_set()
+
+    def serves_namespace(self, namespace: str, kind: str = "pods") -> bool:
+        """缓存是否可以回答 namespace 下 kind 资源的查询。"""
+        return namespace == self.namespace and self.is_synced(kind)
+
+    def items(self, kind: str) -> dict:
+        """返回 { name: raw_object } 的浅拷贝。"""
+        with self._lock:
+            return dict(self._objs[kind])
+
+    def _view(self, name: str, kind: str, build):
+        """按资源版本号缓存派生视图，资源未变化时直接返回上次结果（调用方不应修改）。"""
+        with self._lock:
+            version = self._version[kind]
+            hit = self._views.get(name)
+            if hit is not None and hit[0] == version:
+                return hit[1]
+            value = build(self._objs[kind].values())
+            self._views[name] = (version, value)
+            return value
+
+    def running_pods(self):
+        """返回 Running Pod 名字集合。"""
+        return self._view("running_pods", "pods", self.cluster.running_pod_names)
+
+    def node_internal_ips(self) -> dict[str, str]:
+        """返回 { node_name: internal_ip }。"""
+        return self._view(
+            "node_internal_ips", "nodes",
+            lambda nodes: {n["metadata"]["name"]: self.cluster.node_internal_ip(n) for n in nodes}
+        )
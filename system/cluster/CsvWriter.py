@@ -0,0 +1,85 @@
+# cluster/csv_writer.py
+
+"""
+CsvWriter
+=========
+
+监控器共用的 CSV 追加写入器：
+  - 每个路径只在第一次写入时 makedirs + os.open(O_APPEND)，之后复用同一个 fd；
+  - 新文件（长度为 0）自动写入表头；
+  - 行先按路径暂存在内存中，由调用方在每个周期/事件结束时 flush()，
+    每个文件一次 os.write（不经过 TextIOWrapper 的编码与缓冲层），进程退出时自动写出并关闭。
+每个监控器在整个生命周期内持有一个实例，只在自己的线程中写入并在每个周期/事件批次结束时 flush()。
+各监控器的行模板统一使用 % 格式化字符串，配合 write_line 一次生成整行。
+
+timestamp() 返回 CSV 使用的 "%Y-%m-%d %H:%M:%S" 时间戳，同一秒内复用上次格式化的结果。
+"""
+
+import os, time, atexit
+
+# (秒, 格式化字符串)；整体替换一个元组，多线程读写无需加锁
+_last_ts = (0, "")
+
+
+def timestamp() -> str:
+    """当前本地时间 "%Y-%m-%d %H:%M:%S"，秒数未变化时不再调用 strftime。"""
+    global _last_ts
+    now = int(time.time())
+    sec, ts = _last_ts
+    if now != sec:
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        _last_ts = (now, ts)
+    return ts
+
+
+class CsvWriter:
+    """按路径缓存 fd 的 CSV 追加写入器。"""
+
+    def __init__(self):
+        self._fd = {}       # path -> fd
+        self._pending = {}  # path -> 待写入的行
+        self._dirs = set()  # 已确认存在的目录
+        atexit.register(self.close)
+
+    def _buffer(self, path: str, header: str) -> list:
+        buf = self._pending.get(path)
+        if buf is None:
+            if path not in self._fd:
+                # 同一目录下的多个文件（如同一任务的各个 Pod）只 makedirs 一次；当前目录下的文件无需创建
+                d = os.path.dirname(path)
+                if d and d not in self._dirs:
+                    os.makedirs(d, exist_ok=True)
+                    self._dirs.add(d)
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._fd[path] = fd
+                # 文件长度为 0 说明是新文件，先写表头
+                if os.fstat(fd).st_size == 0:
+                    os.write(fd, (header + "\n").encode())
+            buf = self._pending[path] = []
+        return buf
+
+    def write(self, path: str, header: str, row: list[str]):
+        """追加一行。"""
+        self._buffer(path, header).append(",".join(row) + "\n")
+
+    def write_line(self, path: str, header: str, line: str):
+        """追加一行已格式化好的文本（需自带换行符）。"""
+        self._buffer(path, header).append(line)
+
+    def writelines(self, path: str, header: str, rows):
+        """一次追加多行（同一文件的一批数据）。"""
+        self._buffer(path, header).extend(",".join(row) + "\n" for row in rows)
+
+    def flush(self):
+        """把暂存的行写入文件，每个文件一次 os.write。"""
+        pending, self._pending = self._pending, {}
+        for path, lines in pending.items():
+            if lines:
+                os.write(self._fd[path], "".join(lines).encode())
+
+    def close(self):
+        """写出暂存的行并关闭所有 fd（可重复调用）。"""
+        self.flush()
+        for fd in self._fd.values():
+            os.close(fd)
+        self._fd.clear()
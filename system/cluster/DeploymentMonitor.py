@@ -4,8 +4,9 @@
 DeploymentMonitor
 =================
 
-监控 Deployment 资源：
-  - 每个采样周期记录所有 Deployment 的期望副本数、可用副本数、就绪副本数。
+监控 Deployment 资源（订阅共享 ClusterStateCache 的事件，不单独 list/watch）：
+  - 订阅时记录所有 Deployment 的期望副本数、可用副本数、就绪副本数，
+    之后仅当这些值发生变化时追加一行。
   - 记录新增或删除的 Deployment 事件到 history 文件。
 输出：
   - data/deployment/<deployment-name>-status.csv
@@ -14,68 +15,77 @@ DeploymentMonitor
     header: timestamp,action,deployment
 """
 
-import os, time, logging
+import logging
 from .ClusterMonitor import ClusterMonitor
+from .CsvWriter import CsvWriter, timestamp
 
 
 class DeploymentMonitor:
     """监控 Kubernetes Deployment 的状态和变更。"""
 
-    def __init__(self, interval: int, namespace: str = "default"):
+    STATUS_HEADER = "timestamp,desired_replicas,available_replicas,ready_replicas"
+    _ROW_FMT = "%s,%d,%d,%d\n"
+    HISTORY_HEADER = "timestamp,action,deployment"
+    HISTORY_PATH = "data/deployment/deployment-history.csv"
+
+    def __init__(self, namespace: str = "default", cluster: ClusterMonitor = None):
         """
-        :param interval: 采样间隔（秒）
         :param namespace: 目标命名空间
+        :param cluster: 共享的 ClusterMonitor 实例，缺省时使用进程内共享实例
         """
-        self.cluster = ClusterMonitor()
-        self.interval = interval
+        self.cluster = cluster or ClusterMonitor.instance()
         self.namespace = namespace
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.csv = CsvWriter()
         # 保存上一次看到的 Deployment 名称集合
         self.prev_deploys= set()
+        # 每个对象上一次写入的状态，值未变化时不重复写行
+        self._last_status: dict[str, tuple] = {}
 
     def _write_csv(self, path: str, header: str, row: list[str]):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        new = not os.path.exists(path)
-        with open(path, "a") as f:
-            if new:
-                f.write(header + "\n")
-            f.write(",".join(row) + "\n")
-
-    def run(self):
-        """循环监控 Deployment，记录状态与新增/删除事件。"""
-        status_header = "timestamp,desired_replicas,available_replicas,ready_replicas"
-        history_header = "timestamp,action,deployment"
-        self.logger.info("deployment资源监控器 DeploymentMonitor started.")
-        while True:
-            ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.csv.write(path, header, row)
 
-            # 获取当前 Deployment 列表及其状态
-            deploys = self.cluster.list_deployments(self.namespace)
-            curr_names = set(deploys.keys())
+    def _write_history(self, ts: str, action: str, name: str):
+        self._write_csv(self.HISTORY_PATH, self.HISTORY_HEADER, [ts, action, name])
+        self.logger.info(f"Deployment {action} {name}")
 
-            # 1) 记录新增/删除 Deployment 到 history
-            added = curr_names - self.prev_deploys
-            removed = self.prev_deploys - curr_names
-            hist_path = "data/deployment/deployment-history.csv"
-            for name in added:
-                self._write_csv(hist_path, history_header, [ts, "ADD", name])
-                self.logger.info(f"Deployment ADD {name}")
-            for name in removed:
-                self._write_csv(hist_path, history_header, [ts, "DEL", name])
-                self.logger.info(f"Deployment DEL {name}")
+    def _write_status(self, ts: str, name: str, sts: tuple):
+        """sts 为 ClusterMonitor.deployment_status 返回的 (desired, available, ready)。"""
+        if self._last_status.get(name) == sts:
+            return
+        self._last_status[name] = sts
+        desired, available, ready = sts
+        self.csv.write_line(f"data/deployment/{name}-status.csv", self.STATUS_HEADER,
+                            self._ROW_FMT % (ts, desired, available, ready))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                f"[{name}] desired={desired}, available={available}, ready={ready}"
+            )
 
-            # 2) 对每个 Deployment 记录状态
-            for name, sts in deploys.items():
-                desired = sts.get("desired", 0)
-                available = sts.get("available", 0)
-                ready = sts.get("ready", 0)
-                row = [ts, str(desired), str(available), str(ready)]
-                path = f"data/deployment/{name}-status.csv"
-                self._write_csv(path, status_header, row)
-                self.logger.debug(
-                    f"[{name}] desired={desired}, available={available}, ready={ready}"
-                )
+    def _on_events(self, events):
+        """
+        ClusterStateCache 回调：新出现的 Deployment 记 ADD，删除的记 DEL，
+        并在状态变化时写一行状态；每批事件结束时 flush 一次。
+        """
+        ts = timestamp()
+        for etype, obj in events:
+            name = obj["metadata"]["name"]
+            if etype == "DELETED":
+                self._last_status.pop(name, None)
+                if name in self.prev_deploys:
+                    self.prev_deploys.discard(name)
+                    self._write_history(ts, "DEL", name)
+                continue
+            if name not in self.prev_deploys:
+                self.prev_deploys.add(name)
+                self._write_history(ts, "ADD", name)
+            self._write_status(ts, name, ClusterMonitor.deployment_status(obj))
+        self.csv.flush()
 
-            # 3) 更新 prev_deploys
-            self.prev_deploys = curr_names
-            time.sleep(self.interval)
+    def start(self):
+        """订阅 Deployment 事件；回调在缓存的 watch 线程中执行，不需要单独的线程。"""
+        state = self.cluster.start_state_cache(self.namespace, kinds=("deployments",))
+        if state.namespace != self.namespace:
+            raise ValueError(f"ClusterStateCache watches namespace {state.namespace}, not {self.namespace}")
+        state.subscribe("deployments", self._on_events)
+        self.logger.info("deployment资源监控器 DeploymentMonitor started.")
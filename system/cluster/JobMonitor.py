@@ -4,8 +4,9 @@
 JobMonitor
 ==========
 
-监控 Job 资源：
-  - 每周期记录所有 Job 的预期完成数、已完成数、当前活跃数。
+监控 Job 资源（订阅共享 ClusterStateCache 的事件，不单独 list/watch）：
+  - 订阅时记录所有 Job 的预期完成数、已完成数、当前活跃数，
+    之后仅当这些值发生变化时追加一行。
   - 记录新增/删除的 Job 事件到 history 文件。
   - 当检测到 Job 从未完成到完成，写入一次运行时长记录。
 输出：
@@ -17,90 +18,99 @@ JobMonitor
     header: job,start_time,completion_time,duration_seconds
 """
 
-import os, time, logging
+import logging
 
 from .ClusterMonitor import ClusterMonitor
+from .CsvWriter import CsvWriter, timestamp
 
 
 class JobMonitor:
     """监控 Kubernetes Job 的状态、变更和运行时长。"""
 
-    def __init__(self, interval: int, namespace: str = "default"):
+    STATUS_HEADER = "timestamp,completions,succeeded,active,failed"
+    _ROW_FMT = "%s,%d,%d,%d,%d\n"
+    HISTORY_HEADER = "timestamp,action,job"
+    RUNTIME_HEADER = "job,start_time,completion_time,duration_seconds"
+    HISTORY_PATH = "data/job/job-history.csv"
+    RUNTIME_PATH = "data/job/job-runtime.csv"
+
+    def __init__(self, namespace: str = "default", cluster: ClusterMonitor = None):
         """
-        :param interval: 采样间隔（秒）
         :param namespace: 目标命名空间
+        :param cluster: 共享的 ClusterMonitor 实例，缺省时使用进程内共享实例
         """
-        self.cluster = ClusterMonitor()
-        self.interval = interval
+        self.cluster = cluster or ClusterMonitor.instance()
         self.namespace = namespace
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.csv = CsvWriter()
         # 保存 Job 上一次的状态
         self.prev_jobs = set()
+        # 每个对象上一次写入的状态，值未变化时不重复写行
+        self._last_status: dict[str, tuple] = {}
         # 保存已记录过完成时长的 Job
         self.completed = set()
 
     def _write_csv(self, path: str, header: str, row: list[str]):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        new = not os.path.exists(path)
-        with open(path, "a") as f:
-            if new:
-                f.write(header + "\n")
-            f.write(",".join(row) + "\n")
-
-    def run(self):
-        """循环监控 Job，记录状态、事件和完成时长。"""
-        status_header = "timestamp,completions,succeeded,active,failed"
-        history_header = "timestamp,action,job"
-        runtime_header = "job,start_time,completion_time,duration_seconds"
-        self.logger.info("Job资源监控器JobMonitor started.")
-        while True:
-            ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.csv.write(path, header, row)
 
-            # 1) 获取当前 Job 列表及其状态
-            jobs = self.cluster.list_jobs(self.namespace)
-            curr_names = set(jobs.keys())
+    def _write_history(self, ts: str, action: str, name: str):
+        self._write_csv(self.HISTORY_PATH, self.HISTORY_HEADER, [ts, action, name])
+        self.logger.info(f"Job {action} {name}")
 
-            # 2) 新增/删除事件记录
-            added = curr_names - self.prev_jobs
-            removed = self.prev_jobs - curr_names
-            hist_path = "data/job/job-history.csv"
-            for name in added:
-                self._write_csv(hist_path, history_header, [ts, "ADD", name])
-                self.logger.info(f"Job ADD {name}")
-            for name in removed:
-                self._write_csv(hist_path, history_header, [ts, "DEL", name])
-                self.logger.info(f"Job DEL {name}")
+    def _write_status(self, ts: str, name: str, info: tuple):
+        """
+        写一行状态；如果 Job 第一次完成且未记录过，同时写运行时长。
+        info 为 ClusterMonitor.job_status 返回的元组。
+        """
+        comp, succ, active, failed, start, end = info
+        cur = (comp, succ, active, failed)
+        if self._last_status.get(name) == cur:
+            return
+        self._last_status[name] = cur
+        self.csv.write_line(f"data/job/{name}-status.csv", self.STATUS_HEADER,
+                            self._ROW_FMT % (ts, comp, succ, active, failed))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                f"[{name}] completions={comp}, succeeded={succ}, active={active}, failed={failed}"
+            )
 
-            # 3) 状态记录 & 完成时长检测
-            for name, info in jobs.items():
-                comp = info.get("completions", 0)
-                succ = info.get("succeeded", 0)
-                active = info.get("active", 0)
-                failed = info.get("failed", 0)
-                row = [ts, str(comp), str(succ), str(active), str(failed)]
-                path = f"data/job/{name}-status.csv"
-                self._write_csv(path, status_header, row)
-                self.logger.debug(
-                    f"[{name}] completions={comp}, succeeded={succ}, active={active}, failed={failed}"
-                )
+        if succ >= comp > 0 and name not in self.completed:
+            # 计算时长（秒）
+            duration = int((end - start).total_seconds()) if start and end else 0
+            rt_row = [
+                name,
+                start.isoformat() if start else "",
+                end.isoformat() if end else "",
+                str(duration)
+            ]
+            self._write_csv(self.RUNTIME_PATH, self.RUNTIME_HEADER, rt_row)
+            self.completed.add(name)
+            self.logger.info(f"Job COMPLETE {name}, duration={duration}s")
 
-                # 如果 Job 第一次完成且未记录过，写运行时长
-                if succ >= comp > 0 and name not in self.completed:
-                    start = info.get("start_time")
-                    end = info.get("completion_time")
-                    # 计算时长（秒）
-                    duration = int((end - start).total_seconds()) if start and end else 0
-                    rt_path = "data/job/job-runtime.csv"
-                    rt_row = [
-                        name,
-                        start.isoformat() if start else "",
-                        end.isoformat() if end else "",
-                        str(duration)
-                    ]
-                    self._write_csv(rt_path, runtime_header, rt_row)
-                    self.completed.add(name)
-                    self.logger.info(f"Job COMPLETE {name}, duration={duration}s")
+    def _on_events(self, events):
+        """
+        ClusterStateCache 回调：新出现的 Job 记 ADD，删除的记 DEL，
+        并在状态变化时写一行状态、检测完成时长；每批事件结束时 flush 一次。
+        """
+        ts = timestamp()
+        for etype, obj in events:
+            name = obj["metadata"]["name"]
+            if etype == "DELETED":
+                self._last_status.pop(name, None)
+                if name in self.prev_jobs:
+                    self.prev_jobs.discard(name)
+                    self._write_history(ts, "DEL", name)
+                continue
+            if name not in self.prev_jobs:
+                self.prev_jobs.add(name)
+                self._write_history(ts, "ADD", name)
+            self._write_status(ts, name, ClusterMonitor.job_status(obj))
+        self.csv.flush()
 
-            # 4) 更新 prev_jobs
-            self.prev_jobs = curr_names
-            time.sleep(self.interval)
+    def start(self):
+        """订阅 Job 事件；回调在缓存的 watch 线程中执行，不需要单独的线程。"""
+        state = self.cluster.start_state_cache(self.namespace, kinds=("jobs",))
+        if state.namespace != self.namespace:
+            raise ValueError(f"ClusterStateCache watches namespace {state.namespace}, not {self.namespace}")
+        state.subscribe("jobs", self._on_events)
+        self.logger.info("Job资源监控器JobMonitor started.")
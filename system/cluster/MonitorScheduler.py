@@ -0,0 +1,54 @@
+# cluster/monitor_scheduler.py
+
+"""
+MonitorScheduler
+================
+
+在一个线程里按各自的 interval 轮流调用多个轮询式监控器的 tick()：
+  - 以最小堆保存 (下次触发时间, 序号, 监控器)，始终等待最早到期的一个；
+  - 等待使用 stop_event.wait(timeout)，stop_event 被 set 后立即退出；
+  - 触发时间基于 time.monotonic，按固定节拍推进，tick 超时导致错过的节拍直接跳过，不补跑。
+相比每个监控器一个线程、各自 sleep，N 个监控器只占用一个线程。
+"""
+
+import heapq, logging, threading, time
+
+
+class MonitorScheduler:
+    """单线程调度多个带 tick() / interval 的监控器。"""
+
+    def __init__(self, monitors: list, stop_event: threading.Event = None):
+        """
+        :param monitors: 具有 tick() 方法与 interval 属性（秒）的监控器
+        :param stop_event: 停止信号，set() 后 run() 在当前 tick 结束时退出
+        """
+        for m in monitors:
+            if not m.interval > 0:
+                raise ValueError(f"{m.__class__.__name__}.interval must be > 0, got {m.interval!r}")
+        self.monitors = monitors
+        self.stop_event = stop_event or threading.Event()
+        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+
+    def run(self):
+        """调度循环，直到 stop_event 被 set。"""
+        now = time.monotonic()
+        heap = [(now, i, m) for i, m in enumerate(self.monitors)]
+        heapq.heapify(heap)
+        self.logger.info(
+            "MonitorScheduler started: " + ", ".join(m.__class__.__name__ for m in self.monitors)
+        )
+        while heap and not self.stop_event.is_set():
+            due, i, m = heap[0]
+            delay = due - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            try:
+                m.tick()
+            except Exception as e:
+                self.logger.error(f"{m.__class__.__name__}.tick() failed: {e}")
+            # 推进到下一个未来的节拍
+            now = time.monotonic()
+            due += m.interval
+            if due <= now:
+                due += ((now - due) // m.interval + 1) * m.interval
+            heapq.heapreplace(heap, (due, i, m))
@@ -16,11 +16,21 @@ NginxSLOMonitor (多阈值版)
 可按需调整指标名称和标签常量。
 """
 
-import os
-import time
+import json
 import logging
-from prometheus_api_client import PrometheusConnect
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
 from .ClusterMonitor import ClusterMonitor
+from .CsvWriter import CsvWriter, timestamp
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库
+    _json_loads = json.loads
 
 
 class NginxSLOMonitor:
@@ -33,6 +43,10 @@ class NginxSLOMonitor:
         Prometheus 服务地址
     interval : int
         采样周期（秒）
+    cluster : ClusterMonitor, optional
+        共享的 ClusterMonitor 实例，缺省时使用进程内共享实例
+    stop_event : threading.Event, optional
+        停止信号，set() 后 run() 退出循环
     """
 
     # ---------- 指标 & 标签 常量 ----------
@@ -51,16 +65,26 @@ class NginxSLOMonitor:
     }
     # -----------------------------------------
 
-    def __init__(self, prom_url: str, interval: int):
-        self.prom = PrometheusConnect(url=prom_url, disable_ssl=True)
+    def __init__(self, prom_url: str, interval: int, cluster: ClusterMonitor = None,
+                 stop_event: threading.Event = None):
+        # 直接用持久 Session 调用 /api/v1/query（不经过 PrometheusConnect 每次重建请求参数）
+        # 每周期 10 个查询并发发出：连接池容量与并发数一致，全部复用 keep-alive 连接
+        n_queries = 4 + 2 * len(self.THRESHOLDS)
+        self.query_url = prom_url.rstrip("/") + "/api/v1/query"
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount(prom_url, HTTPAdapter(pool_connections=1, pool_maxsize=n_queries, max_retries=0))
+        self._executor = ThreadPoolExecutor(max_workers=n_queries, thread_name_prefix="slo-query")
         self.interval = interval
-        # 初始化 ClusterMonitor 并获取 Node→IP 映射
-        self.cluster = ClusterMonitor()
+        self.stop_event = stop_event or threading.Event()
+        # 初始化 ClusterMonitor（可由外部传入共享实例）并获取 Node→IP 映射
+        self.cluster = cluster or ClusterMonitor.instance()
         # MODIFIED: 建立 IP→NodeName 映射，用于文件名替换
         node_ip_map = self.cluster.get_node_internal_ips()  # {node: ip}
         # 反转为 {ip: node}
         self.ip_to_node = {ip: node for node, ip in node_ip_map.items()}
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.csv = CsvWriter()
 
         win = f"[1m]"
 
@@ -101,125 +125,159 @@ class NginxSLOMonitor:
             for name, le in self.THRESHOLDS.items()
         }
 
-    def _query_val(self, promql: str) -> float:
+        # 预先构建每个查询的请求参数，run() 中直接复用
+        self._p_total = {"query": self.q_total}
+        self._p_non2xx = {"query": self.q_non2xx}
+        self._p_slow_global = {name: {"query": q} for name, q in self.q_slow_global.items()}
+        self._p_total_i = {"query": self.q_total_i}
+        self._p_non2xx_i = {"query": self.q_non2xx_i}
+        self._p_slow_instance = {name: {"query": q} for name, q in self.q_slow_instance.items()}
+
+        # 构建表头：动态加入三个阈值列
+        header = [
+            "timestamp",
+            "non2xx_count", "non2xx_percent",
+            "total_requests"
+        ]
+        # 全局慢请求列
+        for name in self.THRESHOLDS:
+            header += [f"slow_count_{name}", f"slow_percent_{name}"]
+        self._header_line = ",".join(header)
+        # 行格式：timestamp,non2xx_count,non2xx_percent,total_requests + 每个阈值 count,percent
+        self._thr = tuple(self.THRESHOLDS)
+        self._row_fmt = "%s,%d,%.2f,%d" + ",%d,%.2f" * len(self._thr) + "\n"
+        # instance -> CSV 路径（ip_to_node 在启动时确定，路径不会变化）
+        self._inst_paths: dict[str, str] = {}
+        # 空闲期（总请求数为 0）写入的全 0 行，只需填入时间戳
+        self._zero_row = "%s,0,0.00,0" + ",0,0.00" * len(self._thr) + "\n"
+
+    def _query(self, params: dict) -> list:
+        """执行 instant query，返回 data.result 列表。"""
+        r = self.session.get(self.query_url, params=params, timeout=5)
+        r.raise_for_status()
+        return _json_loads(r.content)["data"]["result"]
+
+    def _query_val(self, params: dict) -> float:
         """执行 instant query，返回第一条 value 或 0.0。"""
         try:
-            res = self.prom.custom_query(query=promql)
+            res = self._query(params)
             return float(res[0]["value"][1]) if res else 0.0
         except Exception as e:
             self.logger.error(f"Prometheus query error: {e}")
             return 0.0
 
-    def _query_map(self, promql: str) -> dict[str, float]:
+    def _query_map(self, params: dict) -> dict[str, float]:
         """执行按 instance 聚合查询，返回 {instance: value}。"""
-        out: dict[str, float] = {}
+        label = self.LABEL_INSTANCE
         try:
-            for m in self.prom.custom_query(query=promql):
-                inst = m["metric"].get(self.LABEL_INSTANCE, "")
-                out[inst] = float(m["value"][1])
+            return {m["metric"].get(label, ""): float(m["value"][1]) for m in self._query(params)}
         except Exception as e:
             self.logger.error(f"Prometheus query error: {e}")
-        return out
+            return {}
 
-    def _write_csv(self, path: str, header: str, row: list[str]):
-        """
-        将一行数据写入 CSV，若文件不存在则先写表头。
-        """
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        first = not os.path.exists(path)
-        with open(path, "a") as f:
-            if first:
-                f.write(header + "\n")
-            f.write(",".join(row) + "\n")
+    def _instance_path(self, inst: str) -> str:
+        """instance 标签（ip:port）-> 实例 CSV 路径，IP 替换为节点名；结果按 instance 缓存。"""
+        path = self._inst_paths.get(inst)
+        if path is None:
+            ip = inst.split(":")[0]
+            name = self.ip_to_node.get(ip, ip)
+            name = "all-ip" if name.strip() == "*" else name
+            path = self._inst_paths[inst] = f"data/slo/{name}-nginx.csv"
+        return path
 
-    def run(self):
-        """
-        循环采集并写 CSV：
-          - data/slo/all_nginx.csv
-          - data/slo/<instance-ip>-nginx.csv
-        """
-        # 构建表头：动态加入三个阈值列
-        header = [
-            "timestamp",
-            "non2xx_count", "non2xx_percent",
-            "total_requests"
-        ]
-        # 全局慢请求列
-        for name in self.THRESHOLDS:
-            header += [f"slow_count_{name}", f"slow_percent_{name}"]
-        header_line = ",".join(header)
+    def _write_instances(self, ts: str, total_map: dict, non_map: dict, slow_maps: dict):
+        """计算并写入各实例的一行（CsvWriter 只追加到内存缓冲，在调用线程中执行即可）。"""
+        thr = self._thr
+        for inst, tot in total_map.items():
+            path = self._instance_path(inst)
+            non = non_map.get(inst, 0.0)
+            non_pct_i = (non / tot * 100) if tot else 0.0
 
-        self.logger.info("NginxSLOMonitor (multi-threshold) started.")
-        while True:
-            ts = time.strftime("%Y-%m-%d %H:%M:%S")
+            # 慢请求实例值与百分比
+            inst_slow_vals = {name: slow_maps[name].get(inst, 0.0) for name in thr}
+            inst_slow_pcts = {
+                name: (inst_slow_vals[name] / tot * 100) if tot else 0.0
+                for name in thr
+            }
+
+            self.csv.write_line(path, self._header_line, self._row_fmt % (
+                ts, non, non_pct_i, tot,
+                *chain.from_iterable((inst_slow_vals[n], inst_slow_pcts[n]) for n in thr)
+            ))
+
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    f"[{inst.split(':')[0]}] total={tot}, non2xx={non}({non_pct_i:.2f}%), " +
+                    ", ".join(f"slow{n}={inst_slow_vals[n]}({inst_slow_pcts[n]:.2f}%)"
+                              for n in thr)
+                )
 
-            # 全局统计
-            total = self._query_val(self.q_total)
-            non2xx = self._query_val(self.q_non2xx)
+    def tick(self):
+        """采集一次全局与实例级 SLO 数据并写 CSV，由 run() 或 MonitorScheduler 周期调用。"""
+        header_line = self._header_line
+        thr = self._thr
+        row_fmt = self._row_fmt
+        write_line = self.csv.write_line
+        ts = timestamp()
 
-            # 慢请求全局
-            slow_vals = {name: self._query_val(q) for name, q in self.q_slow_global.items()}
+        # 先只查全局总请求数：窗口内没有请求（空闲期）时其余查询结果必然全为 0，
+        # 直接写一行全 0 的全局数据并跳过其余 9 个查询与实例级写入
+        total = self._query_val(self._p_total)
+        if not total:
+            write_line("data/slo/all_nginx.csv", header_line, self._zero_row % ts)
+            self.csv.flush()
+            return
 
-            # 计算百分比
-            non_pct = (non2xx / total * 100) if total else 0.0
-            slow_pcts = {
-                name: (slow_vals[name] / total * 100) if total else 0.0
-                for name in self.THRESHOLDS
-            }
+        # 其余全局/实例级查询同一时刻并发发出，耗时约为单个查询的 RTT
+        submit = self._executor.submit
+        f_non2xx = submit(self._query_val, self._p_non2xx)
+        f_slow = {name: submit(self._query_val, p) for name, p in self._p_slow_global.items()}
+        f_total_map = submit(self._query_map, self._p_total_i)
+        f_non_map = submit(self._query_map, self._p_non2xx_i)
+        f_slow_maps = {name: submit(self._query_map, p) for name, p in self._p_slow_instance.items()}
 
-            # 写全局 CSV
-            row = [
-                ts,
-                str(int(non2xx)), f"{non_pct:.2f}",
-                str(int(total))
-            ]
-            for name in self.THRESHOLDS:
-                row += [str(int(slow_vals[name])), f"{slow_pcts[name]:.2f}"]
-            self._write_csv("data/slo/all_nginx.csv", header_line, row)
+        # 全局统计
+        non2xx = f_non2xx.result()
+
+        # 慢请求全局
+        slow_vals = {name: f.result() for name, f in f_slow.items()}
+
+        # 计算百分比
+        non_pct = (non2xx / total * 100) if total else 0.0
+        slow_pcts = {
+            name: (slow_vals[name] / total * 100) if total else 0.0
+            for name in self.THRESHOLDS
+        }
 
+        # 写全局 CSV
+        write_line("data/slo/all_nginx.csv", header_line, row_fmt % (
+            ts, non2xx, non_pct, total,
+            *chain.from_iterable((slow_vals[n], slow_pcts[n]) for n in thr)
+        ))
+
+        if self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug(
                 f"GLOBAL → total={total}, non2xx={non2xx}({non_pct:.2f}%), " +
                 ", ".join(f"slow{n}={slow_vals[n]}({slow_pcts[n]:.2f}%)"
                           for n in self.THRESHOLDS)
             )
 
-            # 实例级统计
-            total_map = self._query_map(self.q_total_i)
-            non_map   = self._query_map(self.q_non2xx_i)
-            slow_maps = {
-                name: self._query_map(q) for name, q in self.q_slow_instance.items()
-            }
+        # 实例级统计
+        total_map = f_total_map.result()
+        non_map   = f_non_map.result()
+        slow_maps = {name: f.result() for name, f in f_slow_maps.items()}
+        self._write_instances(ts, total_map, non_map, slow_maps)
 
-            for inst, tot in total_map.items():
-                non = non_map.get(inst, 0.0)
-                non_pct_i = (non / tot * 100) if tot else 0.0
-
-                # 慢请求实例值与百分比
-                inst_slow_vals = {name: slow_maps[name].get(inst, 0.0)
-                                  for name in self.THRESHOLDS}
-                inst_slow_pcts = {
-                    name: (inst_slow_vals[name] / tot * 100) if tot else 0.0
-                    for name in self.THRESHOLDS
-                }
-
-                ip = inst.split(":")[0]
-                name = self.ip_to_node.get(ip, ip)
-                name = "all-ip" if name.strip() == "*" else name
-                path = f"data/slo/{name}-nginx.csv"
-                row_i = [
-                    ts,
-                    str(int(non)), f"{non_pct_i:.2f}",
-                    str(int(tot))
-                ]
-                for name in self.THRESHOLDS:
-                    row_i += [str(int(inst_slow_vals[name])),
-                              f"{inst_slow_pcts[name]:.2f}"]
-                self._write_csv(path, header_line, row_i)
+        self.csv.flush()
 
-                self.logger.debug(
-                    f"[{ip}] total={tot}, non2xx={non}({non_pct_i:.2f}%), " +
-                    ", ".join(f"slow{n}={inst_slow_vals[n]}({inst_slow_pcts[n]:.2f}%)"
-                              for n in self.THRESHOLDS)
-                )
-
-            time.sleep(self.interval)
+    def run(self):
+        """
+        循环采集并写 CSV：
+          - data/slo/all_nginx.csv
+          - data/slo/<instance-ip>-nginx.csv
+        """
+        self.logger.info("NginxSLOMonitor (multi-threshold) started.")
+        while not self.stop_event.is_set():
+            self.tick()
+            self.stop_event.wait(self.interval)
+        self._executor.shutdown(wait=False)
@@ -11,15 +11,26 @@ memory: (1 - (node_memory_MemAvailable_bytes / node_memory_MemTotal_bytes)) * 10
 
 """
 
-import os, time, requests, logging
-from prometheus_api_client import PrometheusConnect
+import logging, threading
+from . import Prometheus
+from .CsvWriter import CsvWriter, timestamp
 
 class NodeMonitor:
     """节点监控：采集每个节点的CPU和内存利用率，并输出CSV。"""
-    def __init__(self, prom_url, interval):
-        self.prom = PrometheusConnect(url=prom_url,
-                                      disable_ssl=True)
+
+    # 表头定义
+    HEADER = "timestamp,cpu_usage(core),cpu_capacity(core),cpu_util_percent,memory_usage_bytes,memory_total_bytes,memory_util_percent"
+    # 集群节点信息的表头
+    CLUSTER_HEADER = "timestamp, node_count, added, removed, detailed_nodes"
+    # 每个节点一行（利用率保留1位小数）
+    _ROW_FMT = "%s,%.3f,%.1f,%.1f,%d,%d,%.1f\n"
+    # 合并查询中区分各指标的标签名
+    METRIC_LABEL = "node_monitor_metric"
+
+    def __init__(self, prom_url, interval, stop_event: threading.Event = None):
+        self.prom = Prometheus.connect(prom_url)
         self.interval = interval              # 采样间隔（秒）
+        self.stop_event = stop_event or threading.Event()
         # 准备 PromQL 查询语句
         self.cpu_query = '(1 - avg(rate(node_cpu_seconds_total{mode="idle"}[1m])) by (instance)) * 100'
         self.mem_query = '(1 - (node_memory_MemAvailable_bytes / node_memory_MemTotal_bytes)) * 100'
@@ -35,8 +46,17 @@ class NodeMonitor:
         # 监控节点变化
         self.prev_nodes = set()
         self.mem_total_q = 'node_memory_MemTotal_bytes'
+        # 6 个指标合并为一个 PromQL：每个子查询用 label_replace 打上 metric 标签后以 or 拼接，
+        # 每个周期只发一次 HTTP 请求，再按标签拆回各指标
+        self.metrics = ("cpu_util", "mem_util", "cpu_usage", "cpu_capacity", "mem_usage", "mem_total")
+        self.node_query = " or ".join(
+            f'label_replace({q}, "{self.METRIC_LABEL}", "{name}", "", "")'
+            for name, q in zip(self.metrics, (self.cpu_query, self.mem_query, self.cpu_usage_q,
+                                              self.cpu_capacity_q, self.mem_usage_q, self.mem_total_q))
+        )
         # Logger设置
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.csv = CsvWriter()
         self.logger.info(f"node监控器 连接prometheus服务器{self.prom.check_prometheus_connection()}")
 
     def query(self, query):
@@ -49,86 +69,64 @@ class NodeMonitor:
 
     def write_csv(self, filepath, header, line_data):
         """将行数据追加写入CSV文件; 若文件不存在则创建并写入表头。"""
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        file_exists = os.path.isfile(filepath)
-        with open(filepath, 'a') as f:
-            # 文件新建时写入表头
-            if not file_exists:
-                f.write(header + "\n")
-            # 写入CSV行数据
-            f.write(",".join(line_data) + "\n")
+        self.csv.write(filepath, header, line_data)
 
-    def run(self):
-        """启动监控循环，定期查询节点CPU和内存利用率并写入文件。"""
-        self.logger.info("节点性能监控器 NodeMonitor started.")
-        # 表头定义
-        header = "timestamp,cpu_usage(core),cpu_capacity(core),cpu_util_percent,memory_usage_bytes,memory_total_bytes,memory_util_percent"
-        # 集群节点信息的表头
-        cluster_header = "timestamp, node_count, added, removed, detailed_nodes"
-        while True:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")  # 当前时间
-            # 查询 CPU 和 内存 利用率
-            cpu_results = self.query(self.cpu_query)
-            mem_results = self.query(self.mem_query)
-            # 将结果整理为 节点:值 字典，方便匹配
-            cpu_util_map = {}
-            for item in cpu_results:
-                node = item['metric'].get('instance', '<unknown>')
-                value = item['value'][1]  # [ timestamp, value ]
-                cpu_util_map[node] = value
-            mem_util_map = {}
-            for item in mem_results:
-                node = item['metric'].get('instance', '<unknown>')
-                value = item['value'][1]
-                mem_util_map[node] = value
-            usage_cpu = {d["metric"]["instance"]: float(d["value"][1]) for d in self.query(self.cpu_usage_q)}
-            cap_cpu = {d["metric"]["instance"]: float(d["value"][1]) for d in self.query(self.cpu_capacity_q)}
-            usage_mem = {d["metric"]["instance"]: float(d["value"][1]) for d in self.query(self.mem_usage_q)}
-            total_mem = {d["metric"]["instance"]: float(d["value"][1]) for d in self.query(self.mem_total_q)}
-            # 遍历所有节点的数据并写入各自文件
-            for node, cpu_val in cpu_util_map.items():
-                # 若内存结果中没有该节点，跳过或设为0
-                cpu_use = usage_cpu.get(node, 0.0)
-                cpu_cap = cap_cpu.get(node, 0.0)
-                cpu_pct = cpu_util_map.get(node, 0.0)
-                mem_use = usage_mem.get(node, 0.0)
-                mem_tot = total_mem.get(node, 0.0)
-                mem_pct = mem_util_map.get(node, 0.0)
+    def tick(self):
+        """采集一次节点CPU和内存利用率并写入文件，由 run() 或 MonitorScheduler 周期调用。"""
+        ts = timestamp()  # 当前时间（同一秒内复用格式化结果）
+        # 一次查询取回 CPU/内存利用率、CPU 使用量/总量、内存使用量/总量，整理为 指标 -> {节点: 值}
+        by_metric = {name: {} for name in self.metrics}
+        for item in self.query(self.node_query):
+            labels = item['metric']
+            values = by_metric.get(labels.get(self.METRIC_LABEL))
+            if values is not None:
+                values[labels.get('instance', '<unknown>')] = float(item['value'][1])  # [ timestamp, value ]
+        (cpu_util_map, mem_util_map, usage_cpu, cap_cpu,
+         usage_mem, total_mem) = (by_metric[name] for name in self.metrics)
+        # 遍历所有节点的数据并写入各自文件
+        for node, cpu_val in cpu_util_map.items():
+            # 若内存结果中没有该节点，跳过或设为0
+            cpu_use = usage_cpu.get(node, 0.0)
+            cpu_cap = cap_cpu.get(node, 0.0)
+            cpu_pct = cpu_util_map.get(node, 0.0)
+            mem_use = usage_mem.get(node, 0.0)
+            mem_tot = total_mem.get(node, 0.0)
+            mem_pct = mem_util_map.get(node, 0.0)
 
-                # 组织CSV行数据（利用率保留1位小数）
-                line = [timestamp,
-                        f"{cpu_use:.3f}",
-                        f"{cpu_cap:.1f}",
-                        f"{float(cpu_pct):.1f}",
-                        str(int(mem_use)),
-                        str(int(mem_tot)),
-                        f"{float(mem_pct):.1f}"]
-                filename = f"data/node/{node}-utilization.csv"
-                self.write_csv(filename, header, line)
+            filename = f"data/node/{node}-utilization.csv"
+            self.csv.write_line(filename, self.HEADER, self._ROW_FMT % (
+                ts, cpu_use, cpu_cap, cpu_pct, mem_use, mem_tot, mem_pct))
+            if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(
                     f"[{node}] CPU usage={cpu_use} cores, capacity={cpu_cap} cores, util={cpu_pct}%; "
                     f"MEM usage={mem_use} bytes, total={mem_tot} bytes, util={mem_pct}%"
                 )
-            # 集群节点数量变动
-            curr_nodes = set(usage_cpu.keys())
-            added = curr_nodes - self.prev_nodes
-            removed = self.prev_nodes - curr_nodes
-            added_str = ";".join(f"{n} 节点被新增" for n in added) if added else ""
-            removed_str = ";".join(f"{n} 节点被移除" for n in removed) if removed else ""
-            cluster_line = [timestamp,
-                            str(len(curr_nodes)),
-                            added_str,
-                            removed_str,
-                            ";".join(curr_nodes)]
-            self.write_csv("data/node/cluster-info.csv", cluster_header, cluster_line)
-            if added or removed:
-                self.logger.info(f"Cluster Change at {timestamp}: 新增节点={added}, 移除节点={removed}")
-            # 等待下一个采样周期
-            self.prev_nodes = curr_nodes
-            time.sleep(self.interval)
+        # 集群节点数量变动
+        curr_nodes = set(usage_cpu.keys())
+        added = curr_nodes - self.prev_nodes
+        removed = self.prev_nodes - curr_nodes
+        added_str = ";".join(f"{n} 节点被新增" for n in added) if added else ""
+        removed_str = ";".join(f"{n} 节点被移除" for n in removed) if removed else ""
+        cluster_line = [ts,
+                        str(len(curr_nodes)),
+                        added_str,
+                        removed_str,
+                        ";".join(curr_nodes)]
+        self.write_csv("data/node/cluster-info.csv", self.CLUSTER_HEADER, cluster_line)
+        if added or removed:
+            self.logger.info(f"Cluster Change at {ts}: 新增节点={added}, 移除节点={removed}")
+        self.prev_nodes = curr_nodes
+        self.csv.flush()
+
+    def run(self):
+        """启动监控循环，定期查询节点CPU和内存利用率并写入文件。"""
+        self.logger.info("节点性能监控器 NodeMonitor started.")
+        while not self.stop_event.is_set():
+            self.tick()
+            self.stop_event.wait(self.interval)
 
 if __name__ == "__main__":
+    # 模块使用相对导入，需以包方式运行：cd system && python -m cluster.NodeMonitor
     monitor = NodeMonitor(prom_url="http://34.129.107.238:32501",
                           interval=10)
-    while True:
-        monitor.run()
+    monitor.run()
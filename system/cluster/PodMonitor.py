@@ -18,18 +18,24 @@ sum(kube_pod_container_resource_requests_memory_bytes{namespace="default"}) by (
 - 计算 Pod 总请求内存。然后内存利用率 = (内存使用量 / 内存请求)*100%。若某Pod请求内存512Mi(≈536870912字节)，实际使用268435456字节，则利用率50%。
 """
 
-import os, time, requests, logging
-from prometheus_api_client import  PrometheusConnect
+import logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from . import Prometheus
 from .ClusterMonitor import ClusterMonitor
+from .CsvWriter import CsvWriter, timestamp
 
 class PodMonitor:
     """Pod监控：采集默认命名空间下每个Pod的CPU/内存使用量和利用率。"""
-    def __init__(self, prom_url, interval):
-        self.prom = PrometheusConnect(url=prom_url,
-                                      disable_ssl=True)
+
+    HEADER = "timestamp,cpu_usage(core),cpu_util(%),memory_usage(byte),memory_util(%)"
+    # 每个 Pod 一行
+    _ROW_FMT = "%s,%.3f,%.2f,%d,%.2f\n"
+
+    def __init__(self, prom_url, interval, cluster: ClusterMonitor = None, stop_event: threading.Event = None):
         self.interval = interval
-        # ClusterMonitor用于获取Running Pods
-        self.cluster = ClusterMonitor()
+        self.stop_event = stop_event or threading.Event()
+        # ClusterMonitor用于获取Running Pods（可由外部传入共享实例）
+        self.cluster = cluster or ClusterMonitor.instance()
         # CPU使用量: 每Pod每秒使用的CPU核心数
         self.cpu_usage_query = (
             'sum('
@@ -53,7 +59,14 @@ class PodMonitor:
         self.mem_request_query = (
             'sum(kube_pod_container_resource_requests{namespace="default", resource="memory"}) by (pod)'
         )
+        self.queries = [self.cpu_usage_query, self.cpu_request_query,
+                        self.mem_usage_query, self.mem_request_query]
+        # 每周期的 4 个查询并发发出，线程池跨周期复用
+        self._executor = ThreadPoolExecutor(max_workers=len(self.queries), thread_name_prefix="pod-query")
+        # 并发查询共用一个 Session，连接池容量与并发数一致
+        self.prom = Prometheus.connect(prom_url, pool_maxsize=len(self.queries))
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self.csv = CsvWriter()
         self.logger.info(f"pod监控器 连接prometheus服务器{self.prom.check_prometheus_connection()}")
 
     def query(self, query):
@@ -72,70 +85,56 @@ class PodMonitor:
             return parts[0]
         return pod_name  # 若不符合约定命名则返回原名
 
+    @staticmethod
+    def _running_values(rows, running: frozenset) -> dict:
+        """把查询结果整理为 { pod: value }，单次遍历并跳过不在 running 中的 Pod。"""
+        out = {}
+        for d in rows:
+            pod = d["metric"]["pod"]
+            if pod in running:
+                out[pod] = float(d["value"][1])
+        return out
+
     def write_csv(self, filepath, header, line_data):
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        file_exists = os.path.isfile(filepath)
-        with open(filepath, 'a') as f:
-            if not file_exists:
-                f.write(header + "\n")
-            f.write(",".join(line_data) + "\n")
+        self.csv.write(filepath, header, line_data)
 
-    def run(self):
-        """启动Pod监控循环，定期查询所有Pod CPU/内存用量和利用率。"""
-        self.logger.info("PodMonitor started.")
-        header = "timestamp,cpu_usage(core),cpu_util(%),memory_usage(byte),memory_util(%)"
-        while True:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            # 获取当前running的pods
-            running_pods = self.cluster.get_running_pods(namespace="default")
-            if not running_pods:
-                self.logger.warning(f"目前没有正在运行的pods在default空间下")
-                time.sleep(self.interval)
-                continue
-            # 查询四项数据
-            cpu_use = {
-                d["metric"]["pod"]: float(d["value"][1])
-                for d in self.query(self.cpu_usage_query)
-                if d["metric"]["pod"] in running_pods
-            }
-            cpu_req = {
-                d["metric"]["pod"]: float(d["value"][1])
-                for d in self.query(self.cpu_request_query)
-                if d["metric"]["pod"] in running_pods
-            }
-            mem_use = {
-                d["metric"]["pod"]: float(d["value"][1])
-                for d in self.query(self.mem_usage_query)
-                if d["metric"]["pod"] in running_pods
-            }
-            mem_req = {
-                d["metric"]["pod"]: float(d["value"][1])
-                for d in self.query(self.mem_request_query)
-                if d["metric"]["pod"] in running_pods
-            }
-            for pod, cpu_val in cpu_use.items():
-                cpu_request = cpu_req.get(pod, 0.0)
-                cpu_pct = (cpu_val / cpu_request * 100) if cpu_request else 0.0
-
-                mem_val = mem_use.get(pod, 0.0)
-                mem_request = mem_req.get(pod, 0.0)
-                mem_pct = (mem_val / mem_request * 100) if mem_request else 0.0
-
-                row = [
-                    timestamp,
-                    f"{cpu_val:.3f}",
-                    f"{cpu_pct:.2f}",
-                    str(int(mem_val)),
-                    f"{mem_pct:.2f}",
-                ]
-                task = self.get_task_name(pod)
-                path = f"data/pod/{task}/{pod}-utilization.csv"
-                self.write_csv(path, header, row)
+    def tick(self):
+        """采集一次所有Pod CPU/内存用量和利用率，由 run() 或 MonitorScheduler 周期调用。"""
+        ts = timestamp()
+        # 获取当前running的pods
+        running_pods = self.cluster.get_running_pods(namespace="default")
+        if not running_pods:
+            self.logger.warning(f"目前没有正在运行的pods在default空间下")
+            return
+        # 四项数据并发查询，只保留 running 的 Pod
+        cpu_use, cpu_req, mem_use, mem_req = (
+            self._running_values(res, running_pods)
+            for res in self._executor.map(self.query, self.queries)
+        )
+        for pod, cpu_val in cpu_use.items():
+            cpu_request = cpu_req.get(pod, 0.0)
+            cpu_pct = (cpu_val / cpu_request * 100) if cpu_request else 0.0
+
+            mem_val = mem_use.get(pod, 0.0)
+            mem_request = mem_req.get(pod, 0.0)
+            mem_pct = (mem_val / mem_request * 100) if mem_request else 0.0
+
+            task = self.get_task_name(pod)
+            path = f"data/pod/{task}/{pod}-utilization.csv"
+            self.csv.write_line(path, self.HEADER,
+                                self._ROW_FMT % (ts, cpu_val, cpu_pct, mem_val, mem_pct))
 
+            if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(
                     f"{pod}: CPU {cpu_val:.3f}/{cpu_request} "
                     f"({cpu_pct:.1f}%), MEM {mem_val}/{mem_request} "
                     f"({mem_pct:.1f}%)"
                 )
-            time.sleep(self.interval)
+        self.csv.flush()
 
+    def run(self):
+        """启动Pod监控循环，定期查询所有Pod CPU/内存用量和利用率。"""
+        self.logger.info("PodMonitor started.")
+        while not self.stop_event.is_set():
+            self.tick()
+            self.stop_event.wait(self.interval)
@@ -0,0 +1,53 @@
+# cluster/prometheus.py
+
+"""
+各监控器共用的 Prometheus 查询客户端：自持 requests.Session 直接调用 /api/v1/query，
+复用 keep-alive 连接，失败时带退避重试 2 次。
+"""
+
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库
+    _json_loads = json.loads
+
+
+class PrometheusClient:
+    """只包含监控器用到的即时查询与连通性检查。"""
+
+    def __init__(self, prom_url: str, pool_maxsize: int = 1):
+        """
+        :param prom_url: Prometheus 地址
+        :param pool_maxsize: 连接池容量，与同时发出的查询数一致，使并发查询全部复用 keep-alive 连接
+        """
+        self.url = prom_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount(self.url, HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize, max_retries=Retry(total=2, backoff_factor=0.1)))
+
+    def custom_query(self, query: str, timeout: float = 5) -> list:
+        """执行 instant query，返回 data.result 列表；HTTP 错误时抛出异常。"""
+        r = self.session.get(self.url + "/api/v1/query", params={"query": query}, timeout=timeout)
+        r.raise_for_status()
+        return _json_loads(r.content)["data"]["result"]
+
+    def check_prometheus_connection(self) -> bool:
+        """Prometheus 是否可达。"""
+        try:
+            return self.session.get(self.url + "/-/healthy", timeout=5).ok
+        except requests.RequestException:
+            return False
+
+
+def connect(prom_url: str, pool_maxsize: int = 1) -> PrometheusClient:
+    """
+    :param prom_url: Prometheus 地址
+    :param pool_maxsize: 连接池容量，与同时发出的查询数一致
+    """
+    return PrometheusClient(prom_url, pool_maxsize)
@@ -15,9 +15,73 @@ gcp_pricing_catalog.py
   for mt, price in pricing_map.get("us-central1", {}).items():
       print(f"{mt}: ${price:.4f}/hour")
 """
-import os, logging, json
+import os, logging, json, pickle, re, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import billing_v1, compute_v1
 
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库
+    orjson = None
+
+# list_compute_skus 返回的轻量 SKU：只保留下游用到的字段
+# 缓存中只保存普通元组：以 python Pricing.py 运行时 Sku 属于 __main__，直接 pickle 的对象无法被 gcp.Pricing 加载
+# unit_price 取自 pricing_info[0].pricing_expression.tiered_rates[0]，无阶梯价格时为 None
+Sku = namedtuple("Sku", ["usage_type", "description", "service_regions", "unit_price"])
+
+# 描述中第一个以常见机型前缀开头的词即为机型族（n2d/n3d/c2d/c3d/c4a 已被 n2/n3/c2/c3/c4 覆盖）
+_MACHINE_FAMILY_RE = re.compile(r"(?:^|\s)((?:n[1-4]|e2|c[2-4]|m[23]|h3)\S*)", re.IGNORECASE)
+
+# 描述中包含任一关键字的 SKU 不参与定价（自定义机型、预留、单租户、GPU、DWS、优化型等）
+SKU_DESC_BLACKLIST = ("Custom", "Reserved", "Sole Tenancy", "GPU", "NVIDIA", "DWS", "Optimized")
+# 合并为一个正则，一次 search 完成全部子串匹配
+_SKU_DESC_BLACKLIST_RE = re.compile("|".join(map(re.escape, SKU_DESC_BLACKLIST)))
+
+
+def _load_json(path: str):
+    """读取 JSON 缓存文件，优先使用 orjson 解析。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _dump_json(data, path: str):
+    """以 2 空格缩进把 data 写入 JSON 文件（UTF-8，不转义非 ASCII 字符），一次 write 写出。"""
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(payload)
+
+
+def _pickle_path(json_path: str) -> str:
+    """JSON 缓存对应的 pickle 副本路径：xxx.json -> xxx.pkl。"""
+    return os.path.splitext(json_path)[0] + ".pkl"
+
+
+def _load_cache(json_path: str):
+    """
+    读取缓存：pickle 副本存在且不比 JSON 旧时直接 pickle.load（比解析 JSON 快），
+    否则解析 JSON（例如 JSON 被手动修改过）。
+    """
+    pkl_path = _pickle_path(json_path)
+    if os.path.exists(pkl_path) and os.path.getmtime(pkl_path) >= os.path.getmtime(json_path):
+        try:
+            with open(pkl_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"pickle 缓存 {pkl_path} 无法读取，改用 JSON: {e}")
+    return _load_json(json_path)
+
+
+def _write_cache(data, json_path: str):
+    """写入缓存：JSON 供人查看，同目录下的 pickle 副本供下次快速加载。"""
+    _dump_json(data, json_path)
+    with open(_pickle_path(json_path), "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
 
 class PricingClient:
 
@@ -27,11 +91,20 @@ class PricingClient:
     pricing_path = "./data/gcp/pricing_map.json"
     machine_types_path = "./data/gcp/machine_types.json"
     region_machine_price_path = "./data/gcp/region_machine_prices.json"
+    skus_cache_path = "./data/gcp/skus_raw.pkl"
+    # Catalog 中的 SKU 大约每周才更新，本地缓存 24 小时内有效
+    SKU_CACHE_TTL = 24 * 3600
+    # 并发拉取各可用区机型时的线程数
+    ZONE_WORKERS = 16
 
     def __init__(self):
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self.client = billing_v1.CloudCatalogClient()
         self.compute_client = compute_v1.MachineTypesClient()
+        self.zones_client = compute_v1.ZonesClient()
+        # 已加载/计算过的结果，同一实例内不再重复读取磁盘缓存
+        self._pricing_cache = None
+        self._mt_cache = None
 
         self.logger.info("谷歌账单和机器类型池服务初始化 Initialized CloudCatalogClient")
 
@@ -40,9 +113,18 @@ class PricingClient:
         分页获取 Compute Engine 下的所有 SKU，并做以下过滤：
           1. resource_family == "Compute"
           2. usage_type in ("OnDemand", "Preemptible")
-          3. description 不包含 "Custom"
-        返回过滤后的 SKU 对象列表。
+          3. description 不包含 SKU_DESC_BLACKLIST 中的任一关键字
+        返回过滤后的 Sku 列表；结果缓存到 skus_cache_path，SKU_CACHE_TTL 内直接读取缓存。
         """
+        cache_path = self.skus_cache_path
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) > time.time() - self.SKU_CACHE_TTL:
+            self.logger.info(f"Cache found at {cache_path}, loading SKUs from file")
+            try:
+                with open(cache_path, "rb") as f:
+                    return [Sku._make(t) for t in pickle.load(f)]
+            except Exception as e:
+                self.logger.warning(f"SKU 缓存 {cache_path} 无法读取，重新获取: {e}")
+
         skus = []
         # .list_skus 返回一个迭代器，自动处理分页
         for sku in self.client.list_skus(parent=self.COMPUTE_ENGINE_SERVICE_NAME):
@@ -52,10 +134,20 @@ class PricingClient:
             if cat.usage_type not in ("OnDemand", "Preemptible"):
                 continue  # only interested in OnDemand and Preemptible
             desc = (sku.description or "")
-            if ("Custom" in desc or "Reserved" in desc or "Sole Tenancy" in desc or "GPU" in desc or "NVIDIA" in desc or
-                    "DWS" in desc or "Optimized" in desc):
+            if _SKU_DESC_BLACKLIST_RE.search(desc) is not None:
                 continue
-            skus.append(sku)
+            tiered = sku.pricing_info[0].pricing_expression.tiered_rates
+            unit_price = None
+            if tiered:
+                unit_price = tiered[0].unit_price.units + tiered[0].unit_price.nanos / 1e9
+            skus.append(Sku(cat.usage_type, desc, list(sku.service_regions or []), unit_price))
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump([tuple(sku) for sku in skus], f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.logger.info(f"Wrote {len(skus)} SKUs to {cache_path}")
         return skus
 
     def get_compute_engine_pricing(self) :
@@ -68,28 +160,28 @@ class PricingClient:
             }
           }
         """
+        if self._pricing_cache is not None:
+            return self._pricing_cache
         # —— 新增：缓存判断 —— #
         if os.path.exists(self.pricing_path):
             self.logger.info(f"Cache found at {self.pricing_path}, loading pricing map from file")
-            with open(self.pricing_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            self._pricing_cache = _load_cache(self.pricing_path)
+            return self._pricing_cache
 
         skus = self.list_compute_skus()
         # 临时结构： region -> billing_type -> mt -> {"cpu_price", "memory_price"}
         pricing_map = {}
         for sku in skus:
-            usage_type = sku.category.usage_type
+            usage_type = sku.usage_type
             # 确保结构存在
-            for region in sku.service_regions or []:
+            for region in sku.service_regions:
                 pricing_map.setdefault(region, {}) \
                     .setdefault(usage_type, {})
 
-            # 从 pricing_info[0].pricing_expression.tiered_rates[0] 获取单价
-            expr = sku.pricing_info[0].pricing_expression
-            if not expr.tiered_rates:
+            # 单价已在 list_compute_skus 中取自 tiered_rates[0]
+            unit_price = sku.unit_price
+            if unit_price is None:
                 continue
-            rate0 = expr.tiered_rates[0]
-            unit_price = rate0.unit_price.units + rate0.unit_price.nanos / 1e9
 
             # 从描述中提取 machine_type
             desc = sku.description or ""
@@ -103,30 +195,22 @@ class PricingClient:
             else:
                 # 过滤掉其它非 CPU/内存 计费项
                 continue
-            mt = None
-            for token in desc.split():
-                tl = token.lower()
-                # 匹配常见机型前缀
-                if tl.startswith(("n1", "n2", "n2d", "n3", "n3d", "n4",
-                                  "e2",
-                                  "c2", "c2d", "c3", "c3d", "c4", "c4a",
-                                  "m3", "m2",
-                                  "h3")):
-                    mt = tl
-                    break
-            if not mt:
+            m = _MACHINE_FAMILY_RE.search(desc)
+            if not m:
                 continue
+            mt = m.group(1).lower()
 
             # 过滤 ARM 架构（t2a- 或 描述含 ARM）
             if mt.startswith("t2a-") or "arm" in desc.lower():
                 continue
 
             # 将价格填入对应 region & usage_type & machine_type
-            for region in sku.service_regions or []:
+            for region in sku.service_regions:
                 entry = pricing_map[region][usage_type] \
                     .setdefault(mt, {"cpu_price": 0.0, "memory_price": 0.0})
                 entry[part] = unit_price
         self.logger.info("gcp可用域机器定价数据获取完毕")
+        self._pricing_cache = pricing_map
         return pricing_map
 
     def get_and_write_pricing(self, filepath: str = "../data/gcp/pricing_map.json"):
@@ -143,37 +227,44 @@ class PricingClient:
             os.makedirs(directory, exist_ok=True)
             self.logger.info(f"Created directory: {directory}")
 
-        # 写入 JSON
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(pricing, f, indent=2, ensure_ascii=False)
+        # 写入 JSON（及 pickle 副本）
+        _write_cache(pricing, filepath)
         self.logger.info(f"定价数据写入Wrote pricing map to {filepath}")
 
     def list_region_machine_types(self):
         """
         使用 google.cloud.compute_v1 列出各区域可用机型及其规格：
           region -> [
-            {"name": "e2-standard-4", "vcpus": 4, "mem_gib": 16.0}, ...
+            {"name": "e2-standard-4", "vcpus": 4, "mem_gib": 16.0, "family": "e2"}, ...
           ]
         排除名称中含 'custom' 的机型。
         """
         #self.logger.info("Fetching machine types via compute_v1 API …")
+        if self._mt_cache is not None:
+            return self._mt_cache
         # 1. 检查缓存
         cache_path = self.machine_types_path
         if os.path.exists(cache_path):
             self.logger.info(f"Cache found at {cache_path}, loading region machine types from file")
-            with open(cache_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            result = _load_cache(cache_path)
+            # 兼容旧版缓存：补上 family 字段
+            for mts in result.values():
+                for mt in mts:
+                    if "family" not in mt:
+                        mt["family"] = mt["name"].split("-", 1)[0]
+            self._mt_cache = result
+            return result
 
         result = {}
 
-        req = compute_v1.types.AggregatedListMachineTypesRequest(project=self.project_id)
-        agg = self.compute_client.aggregated_list(request=req)
-        for zone_scope, resp in agg:
-            # zone_scope 格式: "zones/{zone}"
-            if resp.machine_types:
-                zone = zone_scope.split("/")[-1]  # e.g. "us-central1-a"
-                region = "-".join(zone.split("-")[:-1])  # e.g. "us-central1"
-                for mt in resp.machine_types:
+        # 先列出所有可用区，再按可用区并发调用 MachineTypes.list（网络 I/O 为主，线程可重叠等待）
+        zones = [z.name for z in self.zones_client.list(project=self.project_id)]
+        with ThreadPoolExecutor(max_workers=self.ZONE_WORKERS, thread_name_prefix="machine-types") as ex:
+            per_zone = ex.map(self._list_zone_machine_types, zones)
+            # 按可用区顺序串行合并，结果与逐个请求时一致
+            for zone, machine_types in zip(zones, per_zone):
+                region = "-".join(zone.split("-")[:-1])  # e.g. "us-central1-a" -> "us-central1"
+                for mt in machine_types:
                     name = mt.name  # e2-standard-4
                     if "custom" in name:
                         continue
@@ -182,12 +273,18 @@ class PricingClient:
                     result.setdefault(region, []).append({
                         "name": name,
                         "vcpus": vcpus,
-                        "mem_gib": mem_gib
+                        "mem_gib": mem_gib,
+                        "family": name.split("-", 1)[0]  # e2
                     })
 
         self.logger.info(f"Collected machine types for {len(result)} regions")
+        self._mt_cache = result
         return result
 
+    def _list_zone_machine_types(self, zone: str) -> list:
+        """列出单个可用区的全部机型（list 返回的迭代器自动处理分页）。"""
+        return list(self.compute_client.list(project=self.project_id, zone=zone))
+
     def get_and_write_region_machine_types(self):
         """
                 调用 list_region_machine_types 获取各区域机型规格，并写入指定文件。
@@ -202,9 +299,8 @@ class PricingClient:
             os.makedirs(directory, exist_ok=True)
             self.logger.info(f"Created directory: {directory}")
 
-        # 写入 JSON
-        with open(self.machine_types_path, "w", encoding="utf-8") as f:
-            json.dump(region_types, f, indent=2, ensure_ascii=False)
+        # 写入 JSON（及 pickle 副本）
+        _write_cache(region_types, self.machine_types_path)
         self.logger.info(f"Wrote region machine types to {self.machine_types_path}")
 
 
@@ -219,23 +315,33 @@ class PricingClient:
         unit_map = self.get_compute_engine_pricing()
         specs = self.list_region_machine_types()
 
-        final = {}
+        # 计算阶段只写扁平字典 (region, usage, mt_name) -> total，最后再整理成嵌套结构
+        flat = {}
         for region, mts in specs.items():
-            if region not in unit_map:
+            unit_map_region = unit_map.get(region)
+            if unit_map_region is None:
                 continue
+            # 按机型族分组：每个 (usage, family) 只查一次单价，没有单价的族整组跳过
+            by_family = {}
+            for mt in mts:
+                by_family.setdefault(mt["family"], []).append(mt)
             for usage in ("OnDemand", "Preemptible"):
-                if usage not in unit_map[region]:
+                unit_map_ru = unit_map_region.get(usage)
+                if unit_map_ru is None:
                     continue
-                for mt in mts:
-                    family = mt["name"].split("-")[0]
-                    unit_prices = unit_map[region][usage].get(family)
+                for family, family_mts in by_family.items():
+                    unit_prices = unit_map_ru.get(family)
                     if not unit_prices:
                         continue
                     cpu_p = unit_prices["cpu_price"]
                     mem_p = unit_prices["memory_price"]
-                    total = mt["vcpus"] * cpu_p + mt["mem_gib"] * mem_p
-                    final.setdefault(region, {}) \
-                        .setdefault(usage, {})[mt["name"]] = round(total, 6)
+                    for mt in family_mts:
+                        total = mt["vcpus"] * cpu_p + mt["mem_gib"] * mem_p
+                        flat[(region, usage, mt["name"])] = round(total, 6)
+
+        final = {}
+        for (region, usage, name), total in flat.items():
+            final.setdefault(region, {}).setdefault(usage, {})[name] = total
 
         self.logger.info("Computed full machine-type pricing map")
         return final
@@ -248,8 +354,7 @@ class PricingClient:
         # 1. 如果缓存文件存在，直接加载
         if os.path.exists(self.region_machine_price_path):
             self.logger.info(f"Cache found at {self.region_machine_price_path}, loading region-machine-type prices from file")
-            with open(self.region_machine_price_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return _load_cache(self.region_machine_price_path)
 
         # 2. 否则计算并写入
         self.logger.info("Cache not found, computing region-machine-type prices …")
@@ -262,8 +367,7 @@ class PricingClient:
             self.logger.info(f"Created directory for cache: {directory}")
 
         # 写入缓存
-        with open(self.region_machine_price_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        _write_cache(data, self.region_machine_price_path)
         self.logger.info(f"Wrote region-machine-type prices cache to {self.region_machine_price_path}")
 
         return data
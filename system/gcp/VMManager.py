@@ -11,10 +11,13 @@ gcp_node_manager.py
 
 依赖：
   pip install google-cloud-compute kubernetes
+  （使用 startup_script_bucket 时另需 google-cloud-storage）
 """
 
-import os, json, time, logging
-from google.api_core.exceptions import NotFound
+import os, json, time, random, hashlib, logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core.exceptions import GoogleAPICallError, NotFound, PreconditionFailed
 import paramiko
 from google.cloud import compute_v1
 from cluster.ClusterMonitor import ClusterMonitor
@@ -27,37 +30,115 @@ class VMManager:
         将它们加入 / 退出 Kubernetes 集群。
     """
 
+    # region 信息与 _choose_zone 结果的缓存时间（秒）；region 拓扑以月为单位变化
+    REGION_CACHE_TTL = 3600
+
     def __init__(self,
-                 startup_script_path: str = './config/worker_initial.sh'):
-        self.cluster_monitor = ClusterMonitor()
+                 startup_script_path: str = './config/worker_initial.sh',
+                 connect_retries: int = 8,
+                 connect_retry_delay: float = 1.0,
+                 startup_script_bucket: str = None):
+        """
+        :param connect_retries: SSH 连接最大尝试次数
+        :param connect_retry_delay: SSH 重试的退避基数（秒），第 n 次失败后约等待 delay*2^n 秒
+        :param startup_script_bucket: GCS 桶名。指定时初始化脚本只上传一次到该桶，新 VM 通过
+                                      startup-script-url 元数据在启动时自行拉取执行，不再逐台 SSH 上传；
+                                      为 None 时沿用 SSH + SFTP 的方式
+        """
+        self.cluster_monitor = ClusterMonitor.instance()
         self.instances_client = compute_v1.InstancesClient()
         self.machine_types_client = compute_v1.MachineTypesClient()
         # 用于获取可用 zone 列表
         self.regions_client = compute_v1.RegionsClient()
 
         self.project = "single-cloud-ylxq"
+        self.connect_retries = connect_retries
+        self.connect_retry_delay = connect_retry_delay
         project_root = Path(__file__).parents[1]  # system/gcp/VMManager.py -> ../../
         self.startup_script_path = str((project_root / startup_script_path).resolve())
         print(f"Startup script path: {self.startup_script_path}")
 
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        # region -> (过期时间, Region)，RegionsClient.get 的结果
+        self._region_cache = {}
+        # (region, machine_type) -> (过期时间, zone)，_choose_zone 的查询结果
+        self._zone_cache = {}
+        # 本进程创建的实例 -> zone，删除时无需再遍历所有 zone
+        self._node_zones = {}
+        # 已认证的 SSH 连接按 (ip, user) 复用
+        # gs:// 形式的初始化脚本地址，None 表示通过 SSH 执行脚本
+        self.startup_script_url = None
+        if startup_script_bucket:
+            self.startup_script_url = self._publish_startup_script(startup_script_bucket)
+
+    def _publish_startup_script(self, bucket_name: str) -> str:
+        """
+        把初始化脚本上传到 GCS 并返回 gs:// 地址。
+        对象名带内容哈希：脚本未变化时不重复上传，脚本修改后自动换成新对象。
+        """
+        from google.cloud import storage
+        with open(self.startup_script_path, "rb") as f:
+            data = f.read()
+        blob_name = f"{Path(self.startup_script_path).stem}-{hashlib.sha256(data).hexdigest()[:12]}.sh"
+        blob = storage.Client(project=self.project).bucket(bucket_name).blob(blob_name)
+        try:
+            # if_generation_match=0：仅当对象不存在时写入
+            blob.upload_from_string(data, content_type="text/x-sh", if_generation_match=0)
+            self.logger.info(f"初始化脚本已上传到 gs://{bucket_name}/{blob_name}")
+        except PreconditionFailed:
+            self.logger.info(f"初始化脚本已存在于 gs://{bucket_name}/{blob_name}")
+        return f"gs://{bucket_name}/{blob_name}"
 
     def _choose_zone(self, region: str, machine_type: str) -> str:
         """
         自动选择一个可用 zone，其中指定的 machine_type 存在。
-        遍历 region 下所有 zones，返回第一个支持该机型的 zone。
+        并发对 region 下所有 zones 调用 MachineTypes.get，返回按 zone 顺序第一个支持该机型的 zone；
+        结果按 (region, machine_type) 缓存 REGION_CACHE_TTL 秒。
         """
-        region_info = self.regions_client.get(project=self.project, region=region)
-        for zone_url in region_info.zones:
-            zone = zone_url.split('/')[-1]
-            # 检查 machine_type 是否可用
-            request = compute_v1.ListMachineTypesRequest(project=self.project, zone=zone)
-            for mt in self.machine_types_client.list(request=request):
-                if mt.name == machine_type:
+        key = (region, machine_type)
+        hit = self._zone_cache.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        region_info = self._get_region(region)
+        zones = [zone_url.split('/')[-1] for zone_url in region_info.zones]
+        if zones:
+            with ThreadPoolExecutor(max_workers=len(zones), thread_name_prefix="choose-zone") as ex:
+                available = list(ex.map(lambda z: self._has_machine_type(z, machine_type), zones))
+            for zone, ok in zip(zones, available):
+                if ok:
                     self.logger.info(f"在 zone {zone} 找到机型 {machine_type}")
+                    self._zone_cache[key] = (time.monotonic() + self.REGION_CACHE_TTL, zone)
                     return zone
+        # region 信息可能已过期（zone 列表变化），下次重新获取
+        self.invalidate_region_cache(region)
         raise ValueError(f"在 region {region} 未找到可用的机型 {machine_type}")
 
+    def _get_region(self, region: str):
+        """RegionsClient.get，结果缓存 REGION_CACHE_TTL 秒。"""
+        hit = self._region_cache.get(region)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        region_info = self.regions_client.get(project=self.project, region=region)
+        self._region_cache[region] = (time.monotonic() + self.REGION_CACHE_TTL, region_info)
+        return region_info
+
+    def invalidate_region_cache(self, region: str):
+        """
+        丢弃 region 的缓存信息及其 zone 选择结果；
+        在 zone 选择失败或自动选择的 zone 创建 VM 出错（不提供此机型 / 资源不足等）后调用。
+        """
+        self._region_cache.pop(region, None)
+        for key in [k for k in self._zone_cache if k[0] == region]:
+            self._zone_cache.pop(key, None)
+
+    def _has_machine_type(self, zone: str, machine_type: str) -> bool:
+        """zone 中是否提供 machine_type（单次 get，不列出全部机型）。"""
+        try:
+            self.machine_types_client.get(project=self.project, zone=zone, machine_type=machine_type)
+            return True
+        except NotFound:
+            return False
+
     def create_node(
             self,
             name: str,
@@ -75,6 +156,15 @@ class VMManager:
         else:
             zone = location
         self.logger.info(f"准备创建 VM {name} (zone={zone}, type={machine_type})...")
+        metadata_items = [
+            compute_v1.Items(
+                key="ssh-keys",
+                value=f"root:ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIKlKzCy4htWLghJGtK6W+ojkXEaQCZvxX4Me/sbPlpJG 13160@michael_win"
+            )
+        ]
+        if self.startup_script_url:
+            # 由 VM 的 guest agent 在启动时从 GCS 拉取并以 root 执行
+            metadata_items.append(compute_v1.Items(key="startup-script-url", value=self.startup_script_url))
         instance = compute_v1.Instance(
             name=name,
             machine_type=f"zones/{zone}/machineTypes/{machine_type}",
@@ -96,12 +186,7 @@ class VMManager:
                 ],
                 stack_type="IPV4_ONLY"
             )],
-            metadata=compute_v1.Metadata(items=[
-                compute_v1.Items(
-                    key="ssh-keys",
-                    value=f"root:ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIKlKzCy4htWLghJGtK6W+ojkXEaQCZvxX4Me/sbPlpJG 13160@michael_win"
-                )
-            ]),
+            metadata=compute_v1.Metadata(items=metadata_items),
             service_accounts=[
                 compute_v1.ServiceAccount(
                     email="883507821345-compute@developer.gserviceaccount.com",
@@ -109,26 +194,63 @@ class VMManager:
                 )
             ]
         )
-        op = self.instances_client.insert(project=self.project, zone=zone, instance_resource=instance)
-        op.result()
-        # wait for the instance to be running
-        for _ in range(30):  # 最多等待 5 分钟
+        try:
+            op = self.instances_client.insert(project=self.project, zone=zone, instance_resource=instance)
+            # op.result 在服务端长轮询，插入操作完成即返回
+            op.result(timeout=300)
+        except GoogleAPICallError:
+            if zone != location:
+                # 缓存中选出的 zone 可能已不再可用，下次为该 region 重新选择
+                self.invalidate_region_cache(location)
+            raise
+        self._node_zones[name] = zone
+        if self.startup_script_url:
+            # 脚本在开机时执行（包含开机与初始化耗时），只需等待节点加入集群并 Ready
+            self._wait_for_ready(name, timeout=900)
+            return
+        # 插入完成后实例通常已是 RUNNING；否则按指数退避再查询几次
+        deadline = time.monotonic() + 300  # 最多等待 5 分钟
+        attempt = 0
+        while True:
             inst = self.instances_client.get(project=self.project, zone=zone, instance=name)
             if inst.status == 'RUNNING':
                 self.logger.info(f"VM {name} 已运行（RUNNING）。")
                 break
-            time.sleep(10)
-        else:
-            raise TimeoutError(f"VM {name} 未能在预期时间内启动。")
-        inst = self.instances_client.get(project=self.project, zone=zone, instance=name)
+            delay = self._backoff(attempt)
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"VM {name} 未能在预期时间内启动。")
+            time.sleep(delay)
+            attempt += 1
         access = inst.network_interfaces[0].access_configs
         if not access or not access[0].nat_i_p:
             raise RuntimeError(f"未获取到实例 {name} 的外网 IP。")
         ip = access[0].nat_i_p
-        ssh = self._ssh_connect(ip)
-        self._upload_and_run(ssh, self.startup_script_path)
+        with self._ssh_connect(ip) as ssh:
+            self._upload_and_run(ssh, self.startup_script_path)
         self._wait_for_ready(name)
 
+    def create_nodes(self, specs: list[dict], max_workers: int = None) -> dict:
+        """
+        并发创建一批 VM：specs 中每项为 create_node 的关键字参数（name / location / machine_type / ...）。
+        各 VM 的插入、开机、初始化互不依赖，在线程池中同时进行（缺省最多 8 个并发）。
+        返回 { name: None 或 该节点创建失败的异常 }；specs 为空时返回空字典。
+        """
+        results = {}
+        if not specs:
+            return results
+        workers = min(max_workers or 8, len(specs))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="create-node") as ex:
+            futures = {ex.submit(self.create_node, **spec): spec["name"] for spec in specs}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                    results[name] = None
+                except Exception as e:
+                    self.logger.error(f"创建节点 {name} 失败: {e}")
+                    results[name] = e
+        return results
+
     def _upload_and_run(self, ssh: paramiko.SSHClient, local_script: str):
         """
         上传本地初始化脚本并在远端执行。
@@ -146,26 +268,49 @@ class VMManager:
             raise RuntimeError(f"初始化脚本执行失败: {error}")
         self.logger.info("初始化脚本执行成功。")
 
-    def _ssh_connect(self, ip: str,  max_retries: int = 5, retry_interval: int = 10):
+    @contextmanager
+    def _ssh_connect(self, ip: str, user: str = "root"):
+        """
+        建立到 ip 的 SSH 连接（上下文管理器），with 块结束时关闭连接及其上的所有通道。
+        每台新 VM 只在初始化时连接一次，不做连接复用。
+        """
+        ssh = self._ssh_open(ip, user)
+        try:
+            yield ssh
+        finally:
+            ssh.close()
+
+    def _ssh_open(self, ip: str, user: str = "root", max_retries: int = None, base: float = None,
+                  cap: float = 30.0, budget: float = 180.0, connect_timeout: float = 10):
         """
-        建立 SSH 连接并切换到 root。
+        建立新的 SSH 连接并切换到 root。
+        失败时按指数退避 + 随机抖动重试（min(cap, base*2^n) + U(0, base)），
+        每次连接/握手/认证最多 connect_timeout 秒，总耗时不超过 budget 秒。
         """
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        for attempt in range(1, max_retries + 1):
+        max_retries = max_retries or self.connect_retries
+        base = base or self.connect_retry_delay
+        start = time.monotonic()
+        for attempt in range(max_retries):
+            # 每次重试使用新的 SSHClient，不复用上次失败的半连接
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             try:
-                self.logger.info(f"尝试 SSH 连接到 {ip}（第 {attempt}/{max_retries} 次）")
+                self.logger.info(f"尝试 SSH 连接到 {ip}（第 {attempt + 1}/{max_retries} 次）")
                 ssh.connect(hostname=ip,
-                            username='root',
+                            username=user,
                             key_filename='./config/kube-master-1-key',
-                            timeout=20)
+                            timeout=connect_timeout,
+                            banner_timeout=connect_timeout,
+                            auth_timeout=connect_timeout)
                 self.logger.info(f"SSH 连接成功: {ip}")
                 break
             except Exception as e:
-                self.logger.warning(f"第 {attempt} 次连接失败: {e}")
-                if attempt == max_retries:
-                    raise RuntimeError(f"无法通过 SSH 连接到 {ip}，达到最大重试次数")
-                time.sleep(retry_interval)
+                ssh.close()
+                self.logger.warning(f"第 {attempt + 1} 次连接失败: {e}")
+                delay = min(cap, base * 2 ** attempt) + random.uniform(0, base)
+                if attempt == max_retries - 1 or time.monotonic() - start + delay > budget:
+                    raise RuntimeError(f"无法通过 SSH 连接到 {ip}，达到最大重试次数或超时")
+                time.sleep(delay)
         # 设置 root 密码
         ssh.exec_command("echo 'root:123456' | sudo chpasswd")
         # 切换到 root
@@ -176,13 +321,16 @@ class VMManager:
         time.sleep(1)
         return ssh
 
-    def _wait_for_ready(self, node_name: str, timeout: int = 300, interval: int = 10):
-        start = time.time()
-        while time.time() - start < timeout:
-            if node_name in self.cluster_monitor.get_node_internal_ips():
-                self.logger.info(f"节点 {node_name} Ready。")
-                return
-            time.sleep(interval)
+    @staticmethod
+    def _backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+        """第 attempt 次轮询前的等待秒数：min(cap, base*2^attempt) + U(0, base)。"""
+        return min(cap, base * 2 ** attempt) + random.uniform(0, base)
+
+    def _wait_for_ready(self, node_name: str, timeout: int = 300):
+        # 在共享的 Node watch 上等待，Ready 条件变为 True 时立即返回
+        if self.cluster_monitor.wait_for_node_condition(node_name, "Ready", "True", timeout=timeout):
+            self.logger.info(f"节点 {node_name} Ready。")
+            return
         raise TimeoutError(f"等待节点 {node_name} Ready 超时")
 
     def delete_node(self, node_name: str, location: str, grace_period: int = 30):
@@ -194,53 +342,43 @@ class VMManager:
             self.logger.info(f"从集群中删除节点Deleted Kubernetes Node object {node_name}")
         except Exception as e:
             self.logger.warning(f"Failed to delete Node object {node_name}: {e}")
-        # 3. 在 GCP 中查找并删除实例
-        deleted = False
-        agg = self.instances_client.aggregated_list(project=self.project)
-        for zone_url, scoped_list in agg:
-            instances = scoped_list.instances
-            if not instances:
-                continue
-            zone = zone_url.split('/')[-1]
-            for inst in instances:
-                if inst.name == node_name:
-                    self.logger.info(f"Deleting VM {node_name} in zone {zone}")
-                    op = self.instances_client.delete(
-                        project=self.project,
-                        zone=zone,
-                        instance=node_name
-                    )
-                    op.result()
-                    deleted = True
-                    break
-            if deleted:
-                break
-        if not deleted:
+        # 3. 在 GCP 中查找并删除实例：优先使用创建时记录的 zone，否则由服务端按名字过滤
+        zone = self._node_zones.get(node_name) or self._find_instance_zone(node_name)
+        if zone is None:
             self.logger.warning(f"实例删除时没有找到Instance {node_name} not found in any zone")
             return False
-        # 等待删除
-        self._wait_for_deletion(node_name, zone, timeout=180)
+        self.logger.info(f"Deleting VM {node_name} in zone {zone}")
+        try:
+            op = self.instances_client.delete(
+                project=self.project,
+                zone=zone,
+                instance=node_name
+            )
+        except NotFound:
+            # 记录的 zone 已失效（例如实例在别处被删除后重建），回退到按名字查找
+            self._node_zones.pop(node_name, None)
+            zone = self._find_instance_zone(node_name)
+            if zone is None:
+                self.logger.warning(f"实例删除时没有找到Instance {node_name} not found in any zone")
+                return False
+            op = self.instances_client.delete(project=self.project, zone=zone, instance=node_name)
+        # 等待删除：删除操作完成即表示实例已不存在，无需再轮询 get
+        op.result(timeout=180)
+        self._node_zones.pop(node_name, None)
+        self.logger.info(f"实例 {node_name} 在 zone {zone} 已确认删除")
         return True
 
-    def _wait_for_deletion(self, node_name: str, zone: str, timeout: int = 300):
-        start = time.time()
-        while time.time() - start < timeout:
-            try:
-                # 调用 get，如果资源尚未删除则不会抛 404
-                self.instances_client.get(project=self.project,
-                                          zone=zone,
-                                          instance=node_name)
-                self.logger.debug(f"VM {node_name} still exists in zone {zone}, retrying...")
-                time.sleep(5)
-            except NotFound as e:
-                if e.code == 404:
-                    self.logger.info(f"实例 {node_name} 在 zone {zone} 已确认删除")
-                    return
-                else:
-                    # 其它 HTTP 错误
-                    self.logger.error(f"Error checking deletion of {node_name}: {e}")
-                    raise
-        raise TimeoutError(f"等待实例 {node_name} 在 zone {zone} 删除超时")
+    def _find_instance_zone(self, node_name: str):
+        """用 aggregated_list 的服务端 filter 按名字查找实例所在 zone，找不到返回 None。"""
+        req = compute_v1.AggregatedListInstancesRequest(
+            project=self.project,
+            filter=f'name = "{node_name}"'
+        )
+        for zone_url, scoped_list in self.instances_client.aggregated_list(request=req):
+            for inst in scoped_list.instances:
+                if inst.name == node_name:
+                    return zone_url.split('/')[-1]
+        return None
 
 if __name__== "__main__":
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "./config/single-cloud-ylxq-ed1608c43bb4.json"
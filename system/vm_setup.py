@@ -4,8 +4,6 @@
  - 加入cluster
  - 前提：master已经存在
 """
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
 from gcp.VMManager import VMManager
 import os
 
@@ -18,20 +16,16 @@ def main():
     machine_type = "e2-standard-4"
     vm_manager = VMManager()
 
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        future_to_node = {
-            executor.submit(vm_manager.create_node, name, region, machine_type,20): name
-            for name in node_names
-        }
-
-        for future in as_completed(future_to_node):
-            name = future_to_node[future]
-            try:
-                future.result()
-                print(f"✅ 节点 {name} 创建完成")
-            except Exception as exc:
-                print(f"❌ 节点 {name} 创建失败: {exc}")
-
+    # VMManager.create_nodes 在线程池中并发创建所有节点
+    results = vm_manager.create_nodes([
+        {"name": name, "location": region, "machine_type": machine_type, "disk_size_gb": 20}
+        for name in node_names
+    ])
+    for name, exc in results.items():
+        if exc is None:
+            print(f"✅ 节点 {name} 创建完成")
+        else:
+            print(f"❌ 节点 {name} 创建失败: {exc}")
 
 if __name__ == '__main__':
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "./config/single-cloud-ylxq-ed1608c43bb4.json"